@@ -0,0 +1,134 @@
+"""Lock contention between the feed and recruiters, with per-queue locks against the single lock they replaced.
+
+A feed thread applies a corpus in batches while simulated recruiters hammer random channels with handouts and queue
+counts, as Recruit clicks and status embeds do. The single lock is emulated by handing every queue, the registry and
+the log one shared lock. Throughput is reported for a growing number of recruiter threads; run it on a free-threaded
+build as well to see the scaling without the GIL:
+
+    uv run -m benchmarks.contention [recorded_corpus.jsonl]
+    uv run --python 3.14t -m benchmarks.contention [recorded_corpus.jsonl]
+"""
+
+import random
+import sys
+import threading
+import time
+from contextlib import AbstractContextManager
+
+from httpx_sse import ServerSentEvent
+
+from benchmarks.corpus import REGIONS, generate, load
+from components.errors import EmptyQueue
+from components.queue import QueueManager
+
+CHANNELS = 200
+RECRUITERS = [1, 2, 4, 8, 16]
+DURATION = 2.0
+"seconds each run lasts"
+FEED_RATE = 20_000
+"events per second the feed thread is paced at, far above the live feed so that it contends on every batch"
+
+
+class GlobalLockManager(QueueManager):
+    "every queue, the registry and the log behind one lock, as with the single _queue_lock"
+
+    _shared: threading.RLock
+
+    def _new_lock(self) -> AbstractContextManager:
+        if not hasattr(self, "_shared"):
+            self._shared = threading.RLock()
+
+        return self._shared
+
+
+def make_manager(cls: type[QueueManager], events: list[ServerSentEvent]) -> QueueManager:
+    rnd = random.Random(0)
+    manager = cls(None, batch_window=0.25, batch_size=100)
+
+    for channel_id in range(CHANNELS):
+        manager.add_channel(channel_id, rnd.sample(REGIONS, 3))
+
+    manager._consume(events)
+    manager.flush()
+
+    return manager
+
+
+def feed(manager: QueueManager, events: list[ServerSentEvent], stop: threading.Event, counts: list[int]):
+    start = time.perf_counter()
+
+    for i, event in enumerate(events):
+        if stop.is_set():
+            break
+
+        if (ahead := i / FEED_RATE - (time.perf_counter() - start)) > 0:
+            time.sleep(ahead)
+
+        manager._handle_event(event)
+        counts[0] += 1
+
+    manager.flush()
+
+
+def recruit(manager: QueueManager, seed: int, stop: threading.Event, counts: list[int]):
+    rnd = random.Random(seed)
+
+    while not stop.is_set():
+        channel_id = rnd.randrange(CHANNELS)
+
+        try:
+            handout = manager.hand_out(None, channel_id)
+            manager.commit(handout)
+            counts[0] += len(handout.names)
+        except EmptyQueue:
+            pass
+
+        manager.get_nation_count(rnd.randrange(CHANNELS))
+        counts[1] += 1
+
+
+def run(
+    cls: type[QueueManager], warmup: list[ServerSentEvent], events: list[ServerSentEvent], recruiters: int
+) -> tuple[float, float, float]:
+    "events applied, handouts and nations handed out per second"
+    manager = make_manager(cls, warmup)
+    stop = threading.Event()
+    fed = [0]
+    handed = [[0, 0] for _ in range(recruiters)]
+
+    threads = [threading.Thread(target=feed, args=(manager, events, stop, fed))]
+    threads += [threading.Thread(target=recruit, args=(manager, seed, stop, handed[seed])) for seed in range(recruiters)]
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    time.sleep(DURATION)
+    stop.set()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+
+    return fed[0] / elapsed, sum(h[1] for h in handed) / elapsed, sum(h[0] for h in handed) / elapsed
+
+
+def main():
+    corpus = load(sys.argv[1]) if len(sys.argv) > 1 else generate(200_000)
+    events = [ServerSentEvent(data=data) for data in corpus]
+    warmup, events = events[: len(events) // 4], events[len(events) // 4 :]
+    gil = sys._is_gil_enabled() if hasattr(sys, "_is_gil_enabled") else True
+
+    print(f"python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}, {CHANNELS} channels")
+    print(f"{'recruiters':>10} {'locks':>8} {'events/s':>10} {'clicks/s':>10} {'nations/s':>10}")
+
+    for recruiters in RECRUITERS:
+        for name, cls in (("global", GlobalLockManager), ("striped", QueueManager)):
+            events_rate, clicks, nations = run(cls, warmup, events, recruiters)
+            print(f"{recruiters:>10} {name:>8} {events_rate:>10.0f} {clicks:>10.0f} {nations:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
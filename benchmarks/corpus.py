@@ -0,0 +1,47 @@
+"""Event corpora for the feed benchmarks.
+
+A recorded corpus is a capture of the founding+move feed with one SSE data payload per line. When none is given a
+synthetic corpus with the same shape is generated instead: roughly three moves for every founding, with moves mostly
+involving recently founded nations.
+"""
+
+import json
+import random
+import time
+
+REGIONS = [f"region_{i}" for i in range(200)]
+
+
+def generate(count: int, seed: int = 0, duration: int | None = None) -> list[str]:
+    "a synthetic corpus of count events ending now, spread over duration seconds, or one event per second by default"
+    rnd = random.Random(seed)
+    now = int(time.time())
+    duration = count if duration is None else duration
+    founded: list[str] = []
+    corpus = []
+
+    for i in range(count):
+        timestamp = now - duration + i * duration // count
+
+        if not founded or rnd.random() < 0.25:
+            nation = f"nation_{i}"
+            region = rnd.choice(REGIONS)
+            founded.append(nation)
+
+            text = f"@@{nation}@@ was founded in %%{region}%%."
+            html = f'<a href="nation={nation}">{nation}</a> was founded in <a href="region={region}">{region}</a>.'
+        else:
+            nation = rnd.choice(founded[-500:]) if rnd.random() < 0.8 else f"old_nation_{rnd.randrange(100_000)}"
+            source, destination = rnd.sample(REGIONS, 2)
+
+            text = f"@@{nation}@@ relocated from %%{source}%% to %%{destination}%%."
+            html = f'<a href="nation={nation}">{nation}</a> relocated from {source} to {destination}.'
+
+        corpus.append(json.dumps({"id": str(100_000_000 + i), "htmlStr": html, "str": text, "time": timestamp}))
+
+    return corpus
+
+
+def load(path: str) -> list[str]:
+    with open(path, "r") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
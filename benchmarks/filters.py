@@ -0,0 +1,52 @@
+"""Per-event cost of the global puppet filters at 10, 100 and 1000 patterns.
+
+Compares matching every pattern one by one (the previous behaviour of QueueManager._is_filtered) against FilterEngine,
+both on a stream of unique names and on a stream where names repeat the way they do on the move feed.
+
+    uv run -m benchmarks.filters
+"""
+
+import random
+import re
+import string
+import timeit
+
+from components.filters import FilterEngine
+
+EVENTS = 20_000
+
+
+def make_patterns(count: int, rnd: random.Random) -> list[re.Pattern]:
+    patterns = []
+
+    for _ in range(count):
+        word = "".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 8)))
+        patterns.append(re.compile(rnd.choice([f"^{word}_?\\d+$", f"^\\d+_{word}", f".*{word}.*_[ivx]+$", f"^{word}"])))
+
+    return patterns
+
+
+def make_names(count: int, unique: int, rnd: random.Random) -> list[str]:
+    pool = ["".join(rnd.choices(string.ascii_lowercase + "_", k=rnd.randint(6, 16))) for _ in range(unique)]
+
+    return [rnd.choice(pool) for _ in range(count)]
+
+
+def main():
+    rnd = random.Random(0)
+
+    print(f"{'patterns':>8} {'names':>8} {'naive us/event':>15} {'engine us/event':>16} {'speedup':>8}")
+
+    for count in (10, 100, 1000):
+        patterns = make_patterns(count, rnd)
+
+        for label, names in (("unique", make_names(EVENTS, EVENTS, rnd)), ("repeated", make_names(EVENTS, EVENTS // 20, rnd))):
+            naive = timeit.timeit(lambda: [any(p.match(n) for p in patterns) for n in names], number=1)
+            engine = FilterEngine(patterns)
+            fast = timeit.timeit(lambda: [engine.match(n) for n in names], number=1)
+
+            print(f"{count:>8} {label:>8} {naive / EVENTS * 1e6:>15.2f} {fast / EVENTS * 1e6:>16.2f} {naive / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Write amplification and recovery time of the queue journal at 500 channels sharing 10k queued nations.
+
+Half of the corpus is applied before a snapshot is taken and the other half, interleaved with handouts, only reaches the
+journal. Bytes written per operation are compared against rewriting the whole state on every save, which is what
+queue_state.json used to be, and recovery is timed by loading the snapshot and replaying the journal tail into a fresh
+QueueManager.
+
+    uv run -m benchmarks.journal [recorded_corpus.jsonl]
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from httpx_sse import ServerSentEvent
+
+from benchmarks.corpus import REGIONS, generate, load
+from components.queue import QueueManager
+
+CHANNELS = 500
+HANDOUT_EVERY = 200
+"events between two rounds of handouts"
+HANDOUT_CHANNELS = 25
+"channels that recruit in each round"
+LEGACY_SAMPLE = 25
+"channels serialized to estimate the size of the legacy per-channel dump"
+
+
+def make_manager(directory: str) -> QueueManager:
+    rnd = random.Random(0)
+    manager = QueueManager(None, batch_window=0.25, journal_path=os.path.join(directory, "queue_journal.{}.jsonl"))
+
+    for channel_id in range(CHANNELS):
+        manager.add_channel(channel_id, rnd.sample(REGIONS, 5))
+
+    return manager
+
+
+def legacy_dump_size(manager: QueueManager) -> int:
+    "estimated size of the per-channel JSON dump that used to be rewritten on every save"
+    size = 0
+
+    for channel_id in range(LEGACY_SAMPLE):
+        nations = manager.channel(channel_id).snapshot()
+        entries = [
+            {"name": n.name, "region": n.region, "founding_time": datetime.fromtimestamp(n.founding_time, timezone.utc).isoformat()}
+            for n in nations
+        ]
+        size += len(json.dumps({str(channel_id): entries}))
+
+    return size * CHANNELS // LEGACY_SAMPLE
+
+
+def main():
+    corpus = load(sys.argv[1]) if len(sys.argv) > 1 else generate(40_000, duration=3_000)
+    events = [ServerSentEvent(data=data) for data in corpus]
+    half = len(events) // 2
+
+    with tempfile.TemporaryDirectory() as directory:
+        state_path = os.path.join(directory, "queue_state.json")
+        rnd = random.Random(0)
+
+        manager = make_manager(directory)
+        manager._save_to_disk(state_path)
+        manager._consume(events[:half])
+        manager.flush()
+        manager._save_to_disk(state_path)
+
+        written = manager._journal.written
+        handouts = 0
+
+        for start in range(half, len(events), HANDOUT_EVERY):
+            manager._consume(events[start : start + HANDOUT_EVERY])
+            manager.flush()
+
+            for channel_id in rnd.sample(range(CHANNELS), HANDOUT_CHANNELS):
+                handout = manager.hand_out(None, channel_id)
+                manager.commit(handout)
+                handouts += len(handout.names)
+
+        journaled = manager._journal.written - written
+        operations = len(events) - half + handouts
+        snapshot = os.path.getsize(state_path)
+        legacy = legacy_dump_size(manager)
+
+        print(f"log: {len(manager._log)} nations, {CHANNELS} channels")
+        print(f"journal:  {journaled:>12} bytes for {operations} operations ({journaled / operations:.1f} bytes/operation)")
+        print(f"snapshot: {snapshot:>12} bytes per save")
+        print(f"legacy:   {legacy:>12} bytes per save (estimated from {LEGACY_SAMPLE} channels)")
+
+        recovered = make_manager(directory)
+
+        start = time.perf_counter()
+        recovered._load_from_disk(state_path)
+        elapsed = time.perf_counter() - start
+
+        print(f"recovery: {elapsed * 1000:.0f} ms for the snapshot and the journal tail")
+
+        for channel_id in range(CHANNELS):
+            expected = [n.name for n in manager.channel(channel_id).snapshot()]
+            actual = [n.name for n in recovered.channel(channel_id).snapshot()]
+
+            if expected != actual:
+                sys.exit(f"recovered queue differs for channel {channel_id}")
+
+        print(f"recovered queues identical across {CHANNELS} channels")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Memory per queued nation in the founding log.
+
+Compares the previous representation, a list of plain Nation dataclasses each holding its own region string and a
+tz-aware datetime, against FoundingLog's columns of names, interned region ids and epoch seconds. Both sides keep the
+name index that move handling needs, and every name and region is a fresh string, as it is when parsed off the feed.
+
+    uv run -m benchmarks.memory
+"""
+
+import gc
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from benchmarks.corpus import REGIONS
+from components.queue import FoundingLog, Nation
+
+NATIONS = 100_000
+
+
+@dataclass
+class LegacyNation:
+    name: str
+    region: str
+    founding_time: datetime
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    retained = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    return size
+
+
+def foundings() -> list[tuple[str, str, int]]:
+    rnd = random.Random(0)
+    now = int(time.time())
+
+    return [(f"nation_{i}", rnd.choice(REGIONS), now - NATIONS + i) for i in range(NATIONS)]
+
+
+def build_legacy(records: list[tuple[str, str, int]]):
+    nations = []
+    index = {}
+
+    for name, region, timestamp in records:
+        nation = LegacyNation("".join(name), "".join(region), datetime.fromtimestamp(timestamp, timezone.utc))
+        nations.append(nation)
+        index[nation.name] = len(nations) - 1
+
+    return nations, index
+
+
+def build_log(records: list[tuple[str, str, int]]):
+    log = FoundingLog()
+
+    for name, region, timestamp in records:
+        log.append(Nation("".join(name), "".join(region), timestamp))
+
+    return log
+
+
+def main():
+    records = foundings()
+    legacy = measure(lambda: build_legacy(records))
+    columns = measure(lambda: build_log(records))
+
+    print(f"{NATIONS} nations, {len(REGIONS)} regions")
+    print(f"{'dataclasses':>12}: {legacy / NATIONS:>6.1f} bytes/nation")
+    print(f"{'FoundingLog':>12}: {columns / NATIONS:>6.1f} bytes/nation ({legacy / columns:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Cost of turning feed event payloads into founding/move records.
+
+Compares the previous path, a full json.loads into an Event followed by both regexes, against components.parser.parse.
+
+    uv run -m benchmarks.parser [recorded_corpus.jsonl]
+"""
+
+import json
+import sys
+import timeit
+from datetime import datetime
+
+from benchmarks.corpus import generate, load
+from components.parser import FOUNDING_REGEX, MOVE_REGEX, parse
+
+
+class Event:
+    def __init__(self, id, htmlstr, str, timestamp):
+        self.id = id
+        self.htmlstr = htmlstr
+        self.str = str
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_json(cls, dct):
+        return cls(dct["id"], dct["htmlStr"], dct["str"], int(dct["time"]))
+
+
+def legacy(data: str):
+    event = json.loads(data, object_hook=Event.from_json)
+
+    if match := FOUNDING_REGEX.match(event.str):
+        return match[1], match[2], datetime.fromtimestamp(event.timestamp)
+    elif match := MOVE_REGEX.match(event.str):
+        return match[1], match[2], match[3], datetime.fromtimestamp(event.timestamp)
+
+    return None
+
+
+def main():
+    corpus = load(sys.argv[1]) if len(sys.argv) > 1 else generate(100_000)
+
+    mismatched = sum(
+        1 for data in corpus if (legacy(data) is None) != (parse(data) is None) or (parse(data) and legacy(data)[0] != parse(data).nation)
+    )
+
+    if mismatched:
+        sys.exit(f"{mismatched} events parsed differently")
+
+    before = min(timeit.repeat(lambda: [legacy(data) for data in corpus], number=1, repeat=3))
+    after = min(timeit.repeat(lambda: [parse(data) for data in corpus], number=1, repeat=3))
+
+    print(f"events:  {len(corpus)}")
+    print(f"legacy:  {before / len(corpus) * 1e6:.2f} us/event")
+    print(f"parser:  {after / len(corpus) * 1e6:.2f} us/event ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
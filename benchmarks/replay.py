@@ -0,0 +1,81 @@
+"""Replays an event corpus through both ingestion modes of QueueManager and checks that they build identical queues.
+
+uv run -m benchmarks.replay [recorded_corpus.jsonl]
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from httpx_sse import ServerSentEvent
+
+from benchmarks.corpus import REGIONS, generate, load
+from components.queue import QueueManager
+
+CHANNELS = 200
+BATCH_WINDOW = 0.25
+
+
+def make_manager(mode: str) -> QueueManager:
+    rnd = random.Random(0)
+    manager = QueueManager(None, mode, batch_window=BATCH_WINDOW)
+
+    for channel_id in range(CHANNELS):
+        manager.add_channel(channel_id, rnd.sample(REGIONS, 3))
+
+    return manager
+
+
+def replay_thread(events: list[ServerSentEvent]) -> tuple[QueueManager, float]:
+    manager = make_manager("thread")
+    thread = threading.Thread(target=manager._consume, args=(iter(events),))
+
+    start = time.perf_counter()
+    thread.start()
+    thread.join()
+    manager.flush()
+
+    return manager, time.perf_counter() - start
+
+
+def replay_async(events: list[ServerSentEvent]) -> tuple[QueueManager, float]:
+    manager = make_manager("async")
+
+    async def feed():
+        for event in events:
+            yield event
+
+    start = time.perf_counter()
+    asyncio.run(manager._aconsume(feed()))
+    manager.flush()
+
+    return manager, time.perf_counter() - start
+
+
+def main():
+    corpus = load(sys.argv[1]) if len(sys.argv) > 1 else generate(200_000)
+    events = [ServerSentEvent(data=data) for data in corpus]
+
+    results = {"thread": replay_thread(events), "async": replay_async(events)}
+
+    for mode, (manager, elapsed) in results.items():
+        stats = manager.batch_stats()
+        print(f"{mode:>6}: {len(events) / elapsed:>10.0f} events/s, {stats.batches} batches of {stats.mean_size:.0f} events on average")
+
+    threaded, _ = results["thread"]
+    asynchronous, _ = results["async"]
+
+    for channel_id in range(CHANNELS):
+        expected = [n.name for n in threaded.channel(channel_id).snapshot()]
+        actual = [n.name for n in asynchronous.channel(channel_id).snapshot()]
+
+        if expected != actual:
+            sys.exit(f"queues differ for channel {channel_id}")
+
+    print(f"queues identical across {CHANNELS} channels")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Report latency against the raw telegrams table and against the telegram_daily and telegram_streaks rollups, at
+millions of telegram rows.
+
+A scratch database, named after the configured one with a _bench suffix, is filled with a year of telegrams spread over
+a few channels and is dropped afterwards. Both queries get an index on (channelId, timestamp), so the difference is the
+rows each reads rather than a missing index. Needs the MySQL server from settings.json:
+
+    uv run -m benchmarks.reports [rows]
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiomysql
+
+from components.config.config_manager import configInstance
+from components.telegrams import REPORT_QUERY, STREAKS_QUERY, TelegramBuffer, report_params
+
+ROWS = 2_000_000
+CHANNELS = 20
+RECRUITERS = 400
+DAYS = 365
+BATCH = 10_000
+"rows per insert while filling the table"
+REPEATS = 5
+RANGES = [("1 day", 1), ("7 days", 7), ("30 days", 30), ("1 year", DAYS)]
+
+LEGACY_QUERY = """SELECT users.nation,
+                         SUM(nationCount) AS 'tgcount', COUNT(DISTINCT DATE (telegrams.timestamp)) AS 'days'
+                  FROM telegrams
+                           JOIN users ON users.id = telegrams.recruiterId
+                  WHERE telegrams.timestamp BETWEEN %s AND %s
+                    AND telegrams.channelId = %s
+                  GROUP BY users.id
+                  ORDER BY tgcount DESC
+                  LIMIT 40;"""
+"the report query from before the rollup"
+
+LEGACY_STREAKS = """WITH daily AS (SELECT telegrams.recruiterId, DATE (telegrams.timestamp) AS dt
+                    FROM telegrams
+                        JOIN users
+                    ON users.id = telegrams.recruiterId
+                    WHERE telegrams.channelId = %s
+                    GROUP BY telegrams.recruiterId, DATE (telegrams.timestamp)),
+                        islands AS (
+                    SELECT recruiterId, dt, DATE_SUB(dt, INTERVAL
+                        ROW_NUMBER() OVER (PARTITION BY recruiterId ORDER BY dt)
+                        DAY) AS island
+                    FROM daily)
+                 SELECT users.nation, COUNT(*) AS streak_days
+                 FROM islands
+                          JOIN users ON users.id = islands.recruiterId
+                 GROUP BY islands.recruiterId, islands.island
+                 HAVING streak_days >= 3
+                    AND MAX(dt) >= %s
+                    AND MIN(dt) <= %s
+                 ORDER BY streak_days DESC LIMIT 40;"""
+"the streaks query from before the streaks were kept up to date"
+
+SCHEMA = [
+    "CREATE TABLE users (id INT PRIMARY KEY, nation VARCHAR(40) NOT NULL);",
+    """CREATE TABLE telegrams (id INT AUTO_INCREMENT PRIMARY KEY, recruiterId INT NOT NULL, nationCount INT NOT NULL,
+                               channelId INT NOT NULL, timestamp DATETIME NOT NULL, INDEX (channelId, timestamp));""",
+    """CREATE TABLE telegram_daily (channelId INT NOT NULL, recruiterId INT NOT NULL, day DATE NOT NULL,
+                                    nationCount INT NOT NULL, PRIMARY KEY (channelId, day, recruiterId));""",
+    """CREATE TABLE telegram_streaks (id INT AUTO_INCREMENT PRIMARY KEY, channelId INT NOT NULL, recruiterId INT NOT NULL,
+                                      startDay DATE NOT NULL, lastDay DATE NOT NULL, INDEX (channelId, lastDay),
+                                      INDEX (channelId, recruiterId, lastDay));""",
+]
+
+
+async def fill(pool: aiomysql.Pool, rows: int, now: datetime):
+    rnd = random.Random(0)
+
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.executemany("INSERT INTO users (id, nation) VALUES (%s, %s);", [(i, f"recruiter_{i}") for i in range(RECRUITERS)])
+
+            for offset in range(0, rows, BATCH):
+                await cur.executemany(
+                    "INSERT INTO telegrams (recruiterId, nationCount, channelId, timestamp) VALUES (%s, %s, %s, %s);",
+                    [
+                        (
+                            rnd.randrange(RECRUITERS),
+                            rnd.randint(1, 8),
+                            rnd.randrange(CHANNELS),
+                            now - timedelta(seconds=rnd.randrange(DAYS * 86400)),
+                        )
+                        for _ in range(min(BATCH, rows - offset))
+                    ],
+                )
+
+
+async def timed(pool: aiomysql.Pool, query: str, params: tuple) -> float:
+    "median milliseconds to run a query and fetch its rows"
+    times = []
+
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                await cur.execute(query, params)
+                await cur.fetchall()
+                times.append(time.perf_counter() - start)
+
+    return statistics.median(times) * 1000
+
+
+async def run(rows: int):
+    config = configInstance.data
+    database = f"{config.db_name}_bench"
+    connection = dict(host=config.db_host, port=config.db_port, user=config.db_user, password=config.db_password, autocommit=True)
+
+    async with aiomysql.connect(**connection) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"DROP DATABASE IF EXISTS `{database}`;")
+            await cur.execute(f"CREATE DATABASE `{database}`;")
+
+    pool = await aiomysql.create_pool(db=database, init_command="SET SESSION time_zone='+00:00'", **connection)
+
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                for statement in SCHEMA:
+                    await cur.execute(statement)
+
+        # the end of a range falls mid-day, so the rollup query also reads the partial days at both ends
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+
+        start = time.perf_counter()
+        await fill(pool, rows, now)
+        print(f"{rows} telegrams written in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        await TelegramBuffer(pool).rebuild()
+        print(f"rollup and streaks backfilled in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'range':>8} {'raw ms':>10} {'rollup ms':>10} {'raw streaks':>12} {'streaks ms':>11}")
+
+        for name, days in RANGES:
+            start_time = now - timedelta(days=days, hours=6)
+            raw = await timed(pool, LEGACY_QUERY, (start_time, now, 0))
+            rollup = await timed(pool, REPORT_QUERY, report_params(0, start_time, now))
+            raw_streaks = await timed(pool, LEGACY_STREAKS, (0, start_time, now))
+            streaks = await timed(pool, STREAKS_QUERY, (0, start_time, now))
+            print(f"{name:>8} {raw:>10.1f} {rollup:>10.1f} {raw_streaks:>12.1f} {streaks:>11.1f}")
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+        async with aiomysql.connect(**connection) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"DROP DATABASE IF EXISTS `{database}`;")
+
+
+def main():
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""File size and startup time of binary queue snapshots against JSON, at 500 channels sharing 10k queued nations.
+
+The JSON side is the layout the journal first shipped with, the shared log and every queue's ranges in one document,
+loaded with json.load; the per-channel dump that preceded it is only estimated, as it runs to hundreds of megabytes.
+
+    uv run -m benchmarks.snapshot [recorded_corpus.jsonl]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from httpx_sse import ServerSentEvent
+
+from benchmarks.corpus import generate, load
+from benchmarks.journal import CHANNELS, LEGACY_SAMPLE, legacy_dump_size, make_manager
+from components.queue import Nation, QueueManager
+from components.snapshot import Snapshot, write
+
+
+def load_json(manager: QueueManager, path: str):
+    with open(path, "r") as f:
+        state = json.load(f)
+
+    manager._log.restore(state["start"], (Nation(*nation) for nation in state["log"]))
+
+    for channel_id, queue in manager._queues.items():
+        queue.load_state(state["queues"][str(channel_id)])
+
+
+def load_binary(manager: QueueManager, path: str):
+    with Snapshot(path) as snapshot:
+        manager._restore_snapshot(snapshot)
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start
+
+
+def main():
+    corpus = load(sys.argv[1]) if len(sys.argv) > 1 else generate(40_000, duration=3_000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = make_manager(directory)
+        manager._consume(ServerSentEvent(data=data) for data in corpus)
+        manager.flush()
+
+        state = manager._state(0)
+        json_path = os.path.join(directory, "queue_state.json")
+        binary_path = os.path.join(directory, "queue_state.bin")
+
+        with open(json_path, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+
+        write(binary_path, state)
+
+        json_load = timed(load_json, make_manager(directory), json_path)
+        binary_load = timed(load_binary, make_manager(directory), binary_path)
+        binary_open = timed(lambda: Snapshot(binary_path).close())
+
+        print(f"log: {len(manager._log)} nations, {CHANNELS} channels")
+        print(f"{'':>8} {'bytes':>12} {'startup ms':>11}")
+        print(f"{'legacy':>8} {legacy_dump_size(manager):>12} {'':>11}  size estimated from {LEGACY_SAMPLE} channels")
+        print(f"{'json':>8} {os.path.getsize(json_path):>12} {json_load * 1000:>11.1f}")
+        print(
+            f"{'binary':>8} {os.path.getsize(binary_path):>12} {binary_load * 1000:>11.1f}  opening the mmap alone: {binary_open * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
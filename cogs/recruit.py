@@ -1,4 +1,5 @@
 import logging
+import time
 from datetime import datetime, timezone
 
 import discord
@@ -7,8 +8,10 @@ from discord.ext import commands, tasks
 from discord.ui import Modal, View
 
 from components.bot import Bot
+from components.channel import RecruitmentChannel
 from components.checks import is_global_admin, is_global_admin_text
 from components.errors import NationNotFound, WhitelistError
+from components.queue import MAX_AGE
 
 logger = logging.getLogger("main")
 
@@ -30,22 +33,15 @@ class RegisterRecruitmentChannelModal(Modal, title="Register Recruitment Channel
 
         region = self.region.component.value.strip().lower().replace(" ", "_")
 
+        existing = self.bot.queue_manager.recruitment_channel(interaction.channel.id)
+
         async with self.bot.pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute("SELECT id, disabled FROM recruitment_channels WHERE channelId = %s;", (interaction.channel.id,))
-                existing = await cur.fetchone()
-
-                if existing and not existing[1]:
+                if existing and not existing.disabled:
                     if interaction.channel.id not in self.bot.queue_manager._queues:
-                        await cur.execute(
-                            """SELECT region
-                               FROM exceptions
-                                        JOIN recruitment_channels ON recruitment_channels.id = exceptions.channelId
-                               WHERE recruitment_channels.channelId = %s;""",
-                            (interaction.channel.id,),
-                        )
+                        await cur.execute("SELECT region FROM exceptions WHERE channelId = %s;", (existing.id,))
                         regions = [r[0] for r in await cur.fetchall()]
-                        self.bot.queue_manager.add_channel(interaction.channel.id, regions)
+                        self.bot.queue_manager.add_channel(interaction.channel.id, regions, existing.max_age or MAX_AGE)
                         await interaction.response.send_message(
                             f"Channel was already registered but not loaded. Reloaded with regions: {', '.join(regions)}", ephemeral=True
                         )
@@ -64,34 +60,28 @@ class RegisterRecruitmentChannelModal(Modal, title="Register Recruitment Channel
                                SET disabled  = FALSE,
                                    serverId  = %s,
                                    messageId = %s
-                               WHERE channelId = %s;""",
-                            (interaction.guild.id, message.id, interaction.channel.id),
-                        )
-                        await cur.execute(
-                            """INSERT IGNORE INTO exceptions (channelId, region)
-                               VALUES ((SELECT id FROM recruitment_channels WHERE channelId = %s), %s);""",
-                            (interaction.channel.id, region),
-                        )
-                        await cur.execute(
-                            """SELECT region
-                               FROM exceptions
-                                   JOIN recruitment_channels ON recruitment_channels.id = exceptions.channelId
-                               WHERE recruitment_channels.channelId = %s;""",
-                            (interaction.channel.id,),
+                               WHERE id = %s;""",
+                            (interaction.guild.id, message.id, existing.id),
                         )
+                        await cur.execute("INSERT IGNORE INTO exceptions (channelId, region) VALUES (%s, %s);", (existing.id, region))
+                        await cur.execute("SELECT region FROM exceptions WHERE channelId = %s;", (existing.id,))
                         regions = [r[0] for r in await cur.fetchall()]
-                        self.bot.queue_manager.add_channel(interaction.channel.id, regions)
+
+                        existing.disabled = False
+                        existing.server_id = interaction.guild.id
+                        existing.message_id = message.id
+
+                        self.bot.queue_manager.add_channel(interaction.channel.id, regions, existing.max_age or MAX_AGE)
                         await interaction.response.send_message(f"Re-enabled channel for region: {region}.", ephemeral=True)
                     else:
                         await cur.execute(
                             "INSERT INTO recruitment_channels (serverId, channelId, messageId) VALUES (%s, %s, %s);",
                             (interaction.guild.id, interaction.channel.id, message.id),
                         )
-                        await cur.execute(
-                            "INSERT INTO exceptions (channelId, region) VALUES ("
-                            "(SELECT id FROM recruitment_channels WHERE channelId = %s), %s);",
-                            (interaction.channel.id, region),
-                        )
+                        channel = RecruitmentChannel(cur.lastrowid, interaction.channel.id, message.id, interaction.guild.id, False)
+                        await cur.execute("INSERT INTO exceptions (channelId, region) VALUES (%s, %s);", (channel.id, region))
+
+                        self.bot.queue_manager.put_recruitment_channel(channel)
                         self.bot.queue_manager.add_channel(interaction.channel.id, [region])
                         await interaction.response.send_message(f"Registered channel for region: {region}", ephemeral=True)
 
@@ -150,6 +140,11 @@ class RegisterRecruiterModal(Modal, title="Registration"):
         except AttributeError:
             raise NationNotFound(interaction.user, nation)
 
+        channel = self.bot.queue_manager.recruitment_channel(interaction.channel_id)
+
+        if channel is None or channel.disabled:
+            raise Exception("This channel is not registered as a recruitment channel")
+
         recruiter_id = await self.bot.get_recruiter_id(interaction.user, interaction.channel_id)
 
         async with self.bot.pool.acquire() as conn:
@@ -159,12 +154,16 @@ class RegisterRecruiterModal(Modal, title="Registration"):
                         "UPDATE users SET nation = %s, recruitTemplate = %s, sessionLength = %s, foundedTime = %s WHERE id = %s;",
                         (nation, template, session_length, founded_time, recruiter_id),
                     )
+
+                    if (recruiter := self.bot.recruiters.get((interaction.user.id, interaction.channel_id))) is not None:
+                        recruiter.nation = nation
+                        recruiter.template = template
+                        recruiter.founded_time = founded_time.replace(tzinfo=timezone.utc)
                 else:
                     await cur.execute(
-                        "INSERT INTO users (discordId, nation, recruitTemplate, sessionLength, foundedTime, "
-                        "channelId) VALUES (%s, %s, %s, %s, %s, (SELECT id FROM recruitment_channels WHERE "
-                        "channelId = %s));",
-                        (interaction.user.id, nation, template, session_length, founded_time, interaction.channel_id),
+                        "INSERT INTO users (discordId, nation, recruitTemplate, sessionLength, foundedTime, channelId) "
+                        "VALUES (%s, %s, %s, %s, %s, %s);",
+                        (interaction.user.id, nation, template, session_length, founded_time, channel.id),
                     )
 
                 # await conn.commit()
@@ -252,7 +251,7 @@ class RecruitView(View):
     async def recruit(self, interaction: discord.Interaction, _button: discord.ui.button):
         embed, view, delete_after = await self.bot.create_recruitment_response(interaction.user, interaction.channel_id)
         view.message = await interaction.response.send_message(embed=embed, view=view, ephemeral=True, delete_after=3 + delete_after)
-        await self.bot.update_status_embed(interaction.channel_id)
+        self.bot.status_embeds.schedule(interaction.channel_id)
 
     @discord.ui.button(label="Register", style=discord.ButtonStyle.blurple, custom_id="recruitment_view:register")
     async def register(self, interaction: discord.Interaction, _button: discord.ui.button):
@@ -348,6 +347,17 @@ class RecruitmentCog(commands.Cog):
             f"""**Global**\n```{global_whitelist}```\n**Local**\n```{local_whitelist}```""", ephemeral=True
         )
 
+    @app_commands.command(name="expiry", description="set how many minutes new nations stay in this channel's queue")
+    @app_commands.guild_only()
+    @app_commands.checks.has_permissions(administrator=True)
+    async def expiry(self, interaction: discord.Interaction, minutes: app_commands.Range[int, 5, 1440]):
+        if not interaction.channel_id:
+            raise app_commands.AppCommandError("command must be run in a channel")
+
+        await self.bot.queue_manager.set_max_age(interaction.channel_id, minutes * 60)
+
+        await interaction.response.send_message(f"nations now stay in this channel's queue for {minutes} minutes", ephemeral=True)
+
     admin_command_group = app_commands.Group(name="admin", description="global bot administrator commands")
 
     @admin_command_group.command(name="ignore", description="add a region to the global ignore list")
@@ -364,6 +374,67 @@ class RecruitmentCog(commands.Cog):
 
         await interaction.response.send_message("all set!", ephemeral=True)
 
+    @admin_command_group.command(name="ingestion", description="show how feed events are being batched")
+    @app_commands.check(is_global_admin)
+    async def ingestion(self, interaction: discord.Interaction):
+        stats = self.bot.queue_manager.batch_stats()
+
+        await interaction.response.send_message(
+            f"```Batches:       {stats.batches}\n"
+            f"Events:        {stats.events}\n"
+            f"Batch size:    {stats.mean_size:.1f} mean, {stats.max_size} max\n"
+            f"Added latency: {stats.mean_latency * 1000:.1f}ms mean, {stats.max_latency * 1000:.1f}ms max```",
+            ephemeral=True,
+        )
+
+    @admin_command_group.command(name="embeds", description="show how the last status embed refresh went")
+    @app_commands.check(is_global_admin)
+    async def embeds(self, interaction: discord.Interaction):
+        stats = self.bot.status_embeds.last_pass
+
+        await interaction.response.send_message(
+            f"```Channels:  {stats.channels}\n"
+            f"Edited:    {stats.edited}\n"
+            f"Unchanged: {stats.skipped}\n"
+            f"Failed:    {stats.failed}\n"
+            f"Duration:  {stats.duration * 1000:.0f}ms```",
+            ephemeral=True,
+        )
+
+    @admin_command_group.command(name="rollup", description="rebuild the daily telegram rollup and streaks that reports are read from")
+    @app_commands.check(is_global_admin)
+    async def rollup(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        start = time.perf_counter()
+        await self.bot.telegrams.rebuild()
+
+        await interaction.followup.send(
+            f"Rebuilt the daily telegram rollup and streaks in {time.perf_counter() - start:.1f}s.", ephemeral=True
+        )
+
+    @admin_command_group.command(name="queues", description="show the largest recruitment queues and their estimated memory")
+    @app_commands.check(is_global_admin)
+    async def queues(self, interaction: discord.Interaction, count: app_commands.Range[int, 1, 50] = 20):
+        manager = self.bot.queue_manager
+        usage = manager.queue_usage()
+
+        if not usage:
+            await interaction.response.send_message("There are no recruitment channels.", ephemeral=True)
+            return
+
+        largest = sorted(usage, key=lambda u: u.estimated_bytes, reverse=True)[:count]
+        formatted = "\n".join(
+            f"- <#{u.channel_id}>: {u.nations} nations, ~{u.estimated_bytes / 1024:.1f} KiB, idle {u.idle_for / 60:.0f}m" for u in largest
+        )
+
+        await interaction.response.send_message(
+            f"**Largest queues**\n{formatted}\n"
+            f"{len(usage)} queues, ~{manager.estimated_bytes() / 1024 / 1024:.1f} MiB of a {manager.memory_budget / 1024 / 1024:.0f} MiB budget, "
+            f"capped at {manager.queue_cap} nations each",
+            ephemeral=True,
+        )
+
     filter_command_group = app_commands.Group(name="filter", description="commands for managing global puppet filters")
 
     @filter_command_group.command(name="add", description="add a global name filter")
@@ -398,6 +469,26 @@ class RecruitmentCog(commands.Cog):
         formatted = "\n".join(f"- ``{p}``" for p in matches)
         await interaction.response.send_message(f"Filters matching ``{nation}``:\n{formatted}", ephemeral=True)
 
+    @filter_command_group.command(name="stats", description="show the slowest and least used global name filters")
+    @app_commands.check(is_global_admin)
+    async def filter_stats(self, interaction: discord.Interaction, count: app_commands.Range[int, 1, 25] = 5):
+        stats = self.bot.queue_manager.filter_stats()
+
+        if not stats:
+            await interaction.response.send_message("There are no global filters.", ephemeral=True)
+            return
+
+        slowest = sorted(stats.items(), key=lambda item: item[1].mean_match_time, reverse=True)[:count]
+        deadest = sorted(stats.items(), key=lambda item: (item[1].hits, -item[1].evaluations))[:count]
+
+        formatted_slowest = "\n".join(
+            f"- ``{p}``: {s.mean_match_time * 1e6:.1f}µs mean, {s.max_match_time * 1e6:.1f}µs max over {s.evaluations} samples"
+            for p, s in slowest
+        )
+        formatted_deadest = "\n".join(f"- ``{p}``: {s.hits} hits" for p, s in deadest)
+
+        await interaction.response.send_message(f"**Slowest**\n{formatted_slowest}\n**Fewest hits**\n{formatted_deadest}", ephemeral=True)
+
     @commands.command(name="disable", description="Disable a recruitment channel by ID")
     @commands.check(is_global_admin_text)
     async def disable(self, ctx: commands.Context, channel_id: int):
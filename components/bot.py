@@ -1,6 +1,6 @@
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import aiohttp
 import aiomysql
@@ -9,9 +9,12 @@ from bs4 import BeautifulSoup as bs
 from discord.ext import commands
 
 from components.config.config_manager import configInstance
+from components.channel import RecruitmentChannel
 from components.errors import LastRecruitmentTooRecent, NotRegistered, TooManyRequests
 from components.queue import QueueManager
 from components.recruiter import Recruiter
+from components.status import RefreshStats, StatusEmbeds
+from components.telegrams import REPORT_QUERY, STREAKS_QUERY, TelegramBuffer, report_params
 
 logger = logging.getLogger("main")
 
@@ -59,6 +62,22 @@ class Bot(commands.Bot):
         """The recruitment queue"""
         return self._queue_list
 
+    @property
+    def status_embeds(self) -> StatusEmbeds:
+        """The status embed of each recruitment channel, edited when its queue changes"""
+        return self._status
+
+    @property
+    def telegrams(self) -> TelegramBuffer:
+        """Telegram records waiting to be written, and the daily rollup and streaks they are written to"""
+        return self._telegrams
+
+    @property
+    def recruiters(self) -> Dict[Tuple[int, int], Recruiter]:
+        """Recruiters that have clicked since startup, by discord id and channel id. Cooldowns are checked here before
+        they are claimed in the database"""
+        return self._recruiters
+
     def __init__(self, session: aiohttp.ClientSession, ql: QueueManager, pool: aiomysql.Pool):
         intents = discord.Intents.default()
 
@@ -73,17 +92,22 @@ class Bot(commands.Bot):
         self._reset_in = None
         self._request_timestamps = []
         self._queue_list = ql
+        self._recruiters = {}
+        self._telegrams = TelegramBuffer(pool)
+        self._status = StatusEmbeds(self, ql, delay=configInstance.data.embed_delay)
+
+    async def close(self):
+        self._status.stop()
+        await self._telegrams.stop()
+        await super().close()
 
     async def setup_hook(self):
         import cogs.recruit
 
-        async with self._pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute("SELECT channelId, messageId FROM recruitment_channels WHERE disabled = FALSE;")
-                recruitment_views = await cur.fetchall()
+        self._telegrams.start()
 
-                for _, message_id in recruitment_views:
-                    self.add_view(cogs.recruit.RecruitView(self), message_id=message_id)
+        for channel in self._queue_list.recruitment_channels():
+            self.add_view(cogs.recruit.RecruitView(self), message_id=channel.message_id)
 
         default_cogs = ["base", "recruit", "error_handler"]
 
@@ -103,21 +127,28 @@ class Bot(commands.Bot):
                     # TODO make this into a custom exception!!
                     raise Exception("Channel already registered")
 
+                self._queue_list.put_recruitment_channel(RecruitmentChannel(cur.lastrowid, channel_id, message_id, server_id, False))
+
             # await conn.commit()
 
     async def deregister_recruitment_channel(self, channel_id: int) -> Optional[int]:
         """Disable a recruitment channel and return its status embed message id, or None if not actively registered."""
+        channel = self._queue_list.recruitment_channel(channel_id)
+
+        if channel is None or channel.disabled:
+            return None
+
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute("SELECT messageId FROM recruitment_channels WHERE channelId = %s AND disabled = FALSE;", (channel_id,))
-                row = await cur.fetchone()
+                await cur.execute("UPDATE recruitment_channels SET disabled = TRUE WHERE id = %s;", (channel.id,))
 
-                if row is None:
-                    return None
+        channel.disabled = True
+        self._status.forget(channel_id)
 
-                await cur.execute("UPDATE recruitment_channels SET disabled = TRUE WHERE channelId = %s;", (channel_id,))
+        for key in [key for key in self._recruiters if key[1] == channel_id]:
+            del self._recruiters[key]
 
-                return row[0]
+        return channel.message_id
 
     async def request(self, url: str) -> bs:
         current_time = datetime.now(timezone.utc)
@@ -148,35 +179,38 @@ class Bot(commands.Bot):
             return bs(text, "xml")
 
     async def get_recruiter_id(self, user: discord.User, channel_id: int) -> Optional[int]:
+        channel = self._queue_list.recruitment_channel(channel_id)
+
+        if channel is None or channel.disabled:
+            return None
+
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                num = await cur.execute(
-                    """SELECT users.id
-                       FROM users
-                                JOIN recruitment_channels ON recruitment_channels.id = users.channelId
-                       WHERE users.discordId = %s
-                         AND recruitment_channels.channelId = %s
-                         AND recruitment_channels.disabled = FALSE;""",
-                    (user.id, channel_id),
-                )
+                num = await cur.execute("SELECT id FROM users WHERE discordId = %s AND channelId = %s;", (user.id, channel.id))
 
                 if num == 0:
                     return None
                 else:
                     return (await cur.fetchone())[0]
 
-    async def get_recruiter(self, user: discord.User, channel_id: int):
+    async def get_recruiter(self, user: discord.User, channel_id: int) -> Recruiter:
+        if (recruiter := self._recruiters.get((user.id, channel_id))) is not None:
+            return recruiter
+
+        channel = self._queue_list.recruitment_channel(channel_id)
+
+        if channel is None or channel.disabled:
+            raise NotRegistered(user)
+
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
                 num = await cur.execute(
-                    """SELECT users.id, nation, recruitTemplate, allowRecruitmentAt, foundedTime
+                    """SELECT id, nation, recruitTemplate, allowRecruitmentAt, foundedTime
                        FROM users
-                                JOIN recruitment_channels ON recruitment_channels.id = users.channelId
-                       WHERE users.discordId = %s
-                         AND recruitment_channels.channelId = %s
-                         AND recruitment_channels.disabled = FALSE;
+                       WHERE discordId = %s
+                         AND channelId = %s;
                     """,
-                    (user.id, channel_id),
+                    (user.id, channel.id),
                 )
 
                 if num == 0:
@@ -184,7 +218,7 @@ class Bot(commands.Bot):
                 else:
                     (dbid, nation, template, allow_recruitment_at, founded_time) = await cur.fetchone()
 
-                    return Recruiter(
+                    recruiter = Recruiter(
                         dbid,
                         nation,
                         template,
@@ -194,55 +228,47 @@ class Bot(commands.Bot):
                         founded_time.replace(tzinfo=timezone.utc),
                     )
 
-    async def set_next_recruitment_at(self, recruiter: Recruiter, nation_count: int) -> int | float:
+        # a click that loaded the same recruiter meanwhile wins, so that both see one cooldown
+        return self._recruiters.setdefault((user.id, channel_id), recruiter)
+
+    async def claim_recruitment(self, recruiter: Recruiter, now: datetime, next_recruitment_at: datetime) -> Optional[datetime]:
+        """Start the recruiter's cooldown, as long as the cooldown in the database has run out too. Returns None once
+        claimed, or when the recruiter may recruit again if not"""
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                cooldown = recruiter.get_cooldown(nation_count)
-
-                next_recruitment_timestamp = datetime.now(timezone.utc) + timedelta(seconds=cooldown)
-
-                await cur.execute(
+                # a single conditional update, so two claims can never both see an expired cooldown
+                claimed = await cur.execute(
                     """UPDATE users
                        SET allowRecruitmentAt = %s
-                       WHERE id = %s;
+                       WHERE id = %s
+                         AND (allowRecruitmentAt IS NULL OR allowRecruitmentAt <= %s);
                     """,
-                    (next_recruitment_timestamp, recruiter.id),
+                    (next_recruitment_at, recruiter.id, now),
                 )
 
-                return cooldown
+                if claimed:
+                    return None
 
-    async def update_telegram_count(self, recruiter: Recruiter, nation_count: int):
-        async with self._pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    """INSERT INTO telegrams (recruiterId, nationCount, channelId)
-                       VALUES (%s, %s, (SELECT id
-                                        FROM recruitment_channels
-                                        WHERE channelId = %s));
-                    """,
-                    (recruiter.id, nation_count, recruiter.channel_id),
-                )
+                await cur.execute("SELECT allowRecruitmentAt FROM users WHERE id = %s;", (recruiter.id,))
+                (allow_recruitment_at,) = await cur.fetchone()
+
+                return allow_recruitment_at.replace(tzinfo=timezone.utc)
+
+    def _internal_id(self, channel_id: int) -> Optional[int]:
+        "the id the other tables use for a channel. None for a channel that was never registered, which matches no rows"
+        channel = self._queue_list.recruitment_channel(channel_id)
+
+        return channel.id if channel is not None else None
 
     async def get_telegrams(self, start_time: datetime, end_time: datetime, channel_id: int):
         if start_time > end_time:
             raise Exception("Start time must be before end time")
 
+        await self._telegrams.flush()
+
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(
-                    """SELECT users.nation,
-                              SUM(nationCount) AS 'tgcount', COUNT(DISTINCT DATE (telegrams.timestamp)) AS 'days'
-                       FROM telegrams
-                                JOIN users ON users.id = telegrams.recruiterId
-                                JOIN recruitment_channels ON recruitment_channels.id = telegrams.channelId
-                       WHERE telegrams.timestamp BETWEEN %s AND %s
-                         AND recruitment_channels.channelId = %s
-                       GROUP BY users.id
-                       ORDER BY tgcount DESC
-                       LIMIT 40;
-                    """,
-                    (start_time, end_time, channel_id),
-                )
+                await cur.execute(REPORT_QUERY, report_params(self._internal_id(channel_id), start_time, end_time))
 
                 return await cur.fetchall()
 
@@ -250,32 +276,11 @@ class Bot(commands.Bot):
         if start_time > end_time:
             raise Exception("Start time must be before end time")
 
+        await self._telegrams.flush()
+
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(
-                    """WITH daily AS (SELECT telegrams.recruiterId, DATE (telegrams.timestamp) AS dt
-                       FROM telegrams
-                           JOIN users
-                       ON users.id = telegrams.recruiterId
-                           JOIN recruitment_channels ON recruitment_channels.id = telegrams.channelId
-                       WHERE recruitment_channels.channelId = %s
-                       GROUP BY telegrams.recruiterId, DATE (telegrams.timestamp)),
-                           islands AS (
-                       SELECT recruiterId, dt, DATE_SUB(dt, INTERVAL
-                           ROW_NUMBER() OVER (PARTITION BY recruiterId ORDER BY dt)
-                           DAY) AS island
-                       FROM daily)
-                    SELECT users.nation, COUNT(*) AS streak_days
-                    FROM islands
-                             JOIN users ON users.id = islands.recruiterId
-                    GROUP BY islands.recruiterId, islands.island
-                    HAVING streak_days >= 3
-                       AND MAX(dt) >= %s
-                       AND MIN(dt) <= %s
-                    ORDER BY streak_days DESC LIMIT 40;
-                    """,
-                    (channel_id, start_time, end_time),
-                )
+                await cur.execute(STREAKS_QUERY, (self._internal_id(channel_id), start_time, end_time))
 
                 return await cur.fetchall()
 
@@ -290,11 +295,28 @@ class Bot(commands.Bot):
             reset_in = (recruiter.next_recruitment_at - current_time).total_seconds()
             raise LastRecruitmentTooRecent(user, reset_in)
 
-        nations = self._queue_list.get_nations(user, channel_id)
+        # nothing is awaited between the check and the cooldown being set in memory, so a burst of clicks cannot all
+        # pass the check. the claim in the database then settles races with anything the cache cannot see
+        handout = self._queue_list.hand_out(user, channel_id)
+        nations = handout.names
+        cooldown = recruiter.get_cooldown(len(nations))
+        previous = recruiter.next_recruitment_at
+        recruiter.next_recruitment_at = current_time + timedelta(seconds=cooldown)
 
-        cooldown = await self.set_next_recruitment_at(recruiter, len(nations))
+        try:
+            allow_recruitment_at = await self.claim_recruitment(recruiter, current_time, recruiter.next_recruitment_at)
+        except BaseException:
+            recruiter.next_recruitment_at = previous
+            self._queue_list.give_back(handout)
+            raise
 
-        await self.update_telegram_count(recruiter, len(nations))
+        if allow_recruitment_at is not None:
+            recruiter.next_recruitment_at = allow_recruitment_at
+            self._queue_list.give_back(handout)
+            raise LastRecruitmentTooRecent(user, (allow_recruitment_at - current_time).total_seconds())
+
+        self._queue_list.commit(handout)
+        self._telegrams.add(recruiter.id, len(nations), self._internal_id(channel_id))
 
         embed = discord.Embed(title="Recruit", color=int("2d0001", 16))
         embed.add_field(name="Nations", value="\n".join([f"https://www.nationstates.net/nation={nation}" for nation in nations]))
@@ -335,57 +357,16 @@ class Bot(commands.Bot):
 
         return None
 
-    async def update_status_embed(self, channel_id: int):
-        logger.info("updating status embed for channel %d", channel_id)
-
-        embed = discord.Embed(title="Recruitment Queue")
-        embed.add_field(name="Nations in Queue", value=self._queue_list.get_nation_count(channel_id))
-        embed.add_field(name="Last Updated", value=f"<t:{int(self._queue_list.channel(channel_id).last_updated.timestamp())}:R>")
+    async def update_status_embeds(self) -> RefreshStats:
+        stats = await self._status.refresh()
 
-        async with self._pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute("SELECT messageId FROM recruitment_channels WHERE channelId = %s AND disabled = FALSE;", channel_id)
-
-                message_id = (await cur.fetchone())[0]
-
-                if type(message_id) is not int:
-                    logger.warning("invalid type for message_id: %d", type(message_id))
-                    return
-
-                channel = await self.resolve_channel(channel_id)
-
-                if not channel:
-                    logger.warning("unable to resolve channel %d", channel_id)
-                    return
-
-                try:
-                    message = await channel.fetch_message(message_id)
-                except discord.NotFound:
-                    logger.warning("message: %d not found, skipping", message_id)
-                    return
-                except Exception as e:
-                    logger.warning("unspecified error while retrieving message %d: %s", message_id, e)
-                    return
-
-                from cogs.recruit import RecruitView
-
-                try:
-                    await message.edit(embed=embed, view=RecruitView(self))
-                except discord.HTTPException as e:
-                    logger.warning("Failed to edit message %d in channel %d: %s", message_id, channel_id, e)
+        if stats.edited or stats.failed:
+            logger.info(
+                "Refreshed status embeds in %.2fs: %d edited, %d unchanged, %d failed.",
+                stats.duration,
+                stats.edited,
+                stats.skipped,
+                stats.failed,
+            )
 
-    async def update_status_embeds(self):
-        async with self._pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute("SELECT channelId FROM recruitment_channels WHERE disabled = FALSE;")
-                channels = await cur.fetchall()
-
-                for channel in channels:
-                    if type(channel_id := channel[0]) is not int:
-                        logger.warning("Invalid type for channel_id: %s", type(channel_id))
-                        continue
-
-                    try:
-                        await self.update_status_embed(channel_id)
-                    except Exception as e:
-                        logger.error("Failed to update status embed for channel %d: %s", channel_id, e)
+        return stats
@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RecruitmentChannel:
+    id: int
+    "internal id, which every other table refers to"
+    channel_id: int
+    message_id: int
+    "the status embed"
+    server_id: int
+    disabled: bool
+    max_age: Optional[int] = None
@@ -85,6 +85,12 @@ class ConfigManager:
             "operator": self._data.operator,
             "polling_rate": self._data.polling_rate,
             "period_max": self._data.period_max,
+            "ingestion_mode": self._data.ingestion_mode,
+            "batch_window": self._data.batch_window,
+            "batch_size": self._data.batch_size,
+            "queue_cap": self._data.queue_cap,
+            "memory_budget": self._data.memory_budget,
+            "embed_delay": self._data.embed_delay,
             "bot_token": self._data.bot_token,
             "global_administrators": self._data.global_administrators,
         }
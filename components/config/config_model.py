@@ -44,6 +44,39 @@ class ConfigData:
         """Maximum number of requests that the bot will make in a single bucket"""
         return self._period_max
 
+    @property
+    def ingestion_mode(self) -> str:
+        """How the founding/move feed is read: "thread" for a blocking client on a daemon thread, "async" for a task on the
+        bot's event loop"""
+        return self._ingestion_mode
+
+    @property
+    def batch_window(self) -> float:
+        """Longest time, in seconds, that feed events are buffered before being applied to the queues as one batch. 0
+        applies every event as soon as it arrives"""
+        return self._batch_window
+
+    @property
+    def batch_size(self) -> int:
+        """Number of buffered feed events that triggers a batch to be applied before the window has elapsed"""
+        return self._batch_size
+
+    @property
+    def queue_cap(self) -> int:
+        """Most nations a single channel's queue holds before its oldest are evicted"""
+        return self._queue_cap
+
+    @property
+    def memory_budget(self) -> int:
+        """Estimated memory in MiB the queues may use before the oldest nations are evicted, from idle channels first"""
+        return self._memory_budget
+
+    @property
+    def embed_delay(self) -> float:
+        """Seconds a channel's status embed waits after a Recruit click before it is edited, so that clicks in quick
+        succession share one edit"""
+        return self._embed_delay
+
     @property
     def bot_token(self) -> str:
         return self._bot_token
@@ -64,6 +97,12 @@ class ConfigData:
             operator=dict["operator"],
             polling_rate=dict["polling_rate"],
             period_max=dict["period_max"],
+            ingestion_mode=dict.get("ingestion_mode", "thread"),
+            batch_window=dict.get("batch_window", 0.25),
+            batch_size=dict.get("batch_size", 500),
+            queue_cap=dict.get("queue_cap", 10000),
+            memory_budget=dict.get("memory_budget", 128),
+            embed_delay=dict.get("embed_delay", 2.0),
             bot_token=dict["bot_token"],
             global_administrators=dict["global_administrators"],
         )
@@ -79,6 +118,12 @@ class ConfigData:
         operator="",
         polling_rate=0,
         period_max=0,
+        ingestion_mode="thread",
+        batch_window=0.25,
+        batch_size=500,
+        queue_cap=10000,
+        memory_budget=128,
+        embed_delay=2.0,
         bot_token="",
         global_administrators=[],
     ) -> None:
@@ -90,5 +135,11 @@ class ConfigData:
         self._operator = operator
         self._polling_rate = polling_rate
         self._period_max = period_max
+        self._ingestion_mode = ingestion_mode
+        self._batch_window = batch_window
+        self._batch_size = batch_size
+        self._queue_cap = queue_cap
+        self._memory_budget = memory_budget
+        self._embed_delay = embed_delay
         self._bot_token = bot_token
         self._global_administrators = global_administrators
@@ -0,0 +1,144 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger("main")
+
+UNCOMBINABLE_REGEX = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|^\(\?[aiLmsux]+\)")
+"backreferences, conditionals and global inline flags change meaning or fail to compile inside an alternation"
+
+PROFILE_SAMPLE_RATE = 64
+"one in this many uncached names is timed against every pattern individually"
+
+
+@dataclass
+class FilterStats:
+    evaluations: int = 0
+    "number of sampled, individually timed evaluations"
+    hits: int = 0
+    "number of names this pattern filtered out, counting names already in the verdict cache"
+    match_time: float = 0.0
+    "cumulative time spent in sampled evaluations, in seconds"
+    max_match_time: float = 0.0
+
+    @property
+    def mean_match_time(self) -> float:
+        return self.match_time / self.evaluations if self.evaluations else 0.0
+
+
+class FilterEngine:
+    """the global puppet filters compiled into a single alternation, with a bounded LRU cache of recent verdicts.
+
+    patterns that cannot safely be embedded in the alternation are matched one at a time after it. hits are attributed to
+    a pattern by re-matching only the names the alternation accepted, since capture groups would slow down every miss"""
+
+    _patterns: List[re.Pattern]
+    _combined: Optional[re.Pattern]
+    _combinable: List[re.Pattern]
+    _standalone: List[re.Pattern]
+    _cache: OrderedDict[str, Optional[re.Pattern]]
+    "nation name to the pattern that filtered it, or None"
+    _cache_size: int
+    _stats: dict[str, FilterStats]
+    _evaluated: int
+
+    def __init__(self, patterns: Iterable[re.Pattern] = (), cache_size: int = 4096, stats: Optional[dict[str, FilterStats]] = None):
+        self._patterns = list(patterns)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._stats = {p.pattern: (stats or {}).get(p.pattern, FilterStats()) for p in self._patterns}
+        self._evaluated = 0
+        self._compile()
+
+    def __repr__(self):
+        return f"<FilterEngine patterns={len(self._patterns)} standalone={len(self._standalone)}>"
+
+    def __contains__(self, pattern: re.Pattern) -> bool:
+        return pattern in self._patterns
+
+    def __iter__(self):
+        return iter(self._patterns)
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _compile(self):
+        self._combinable = [p for p in self._patterns if p.flags == re.UNICODE and not UNCOMBINABLE_REGEX.search(p.pattern)]
+        self._standalone = [p for p in self._patterns if p not in self._combinable]
+        self._combined = None
+
+        if self._combinable:
+            try:
+                self._combined = re.compile("|".join(f"(?:{p.pattern})" for p in self._combinable))
+            except re.error as e:
+                logger.warning("unable to combine filters, matching them individually: %s", e)
+                self._combinable = []
+                self._standalone = list(self._patterns)
+
+        self._cache.clear()
+
+    def add(self, pattern: re.Pattern):
+        self._patterns.append(pattern)
+        self._stats.setdefault(pattern.pattern, FilterStats())
+        self._compile()
+
+    def remove(self, pattern: re.Pattern):
+        self._patterns.remove(pattern)
+        self._stats.pop(pattern.pattern, None)
+        self._compile()
+
+    def _evaluate(self, nation: str) -> Optional[re.Pattern]:
+        self._evaluated += 1
+
+        if self._evaluated % PROFILE_SAMPLE_RATE == 0:
+            self._profile(nation)
+
+        if self._combined and self._combined.match(nation):
+            return next(p for p in self._combinable if p.match(nation))
+
+        for pattern in self._standalone:
+            if pattern.match(nation):
+                return pattern
+
+        return None
+
+    def _profile(self, nation: str):
+        for pattern in self._patterns:
+            start = time.perf_counter()
+            pattern.match(nation)
+            elapsed = time.perf_counter() - start
+
+            stats = self._stats[pattern.pattern]
+            stats.evaluations += 1
+            stats.match_time += elapsed
+            stats.max_match_time = max(stats.max_match_time, elapsed)
+
+    def match(self, nation: str) -> bool:
+        try:
+            self._cache.move_to_end(nation)
+        except KeyError:
+            hit = self._evaluate(nation)
+
+            self._cache[nation] = hit
+
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            hit = self._cache[nation]
+
+        if hit is None:
+            return False
+
+        self._stats[hit.pattern].hits += 1
+
+        return True
+
+    def matching(self, nation: str) -> List[str]:
+        "every pattern that matches the nation, not just the first"
+        return [p.pattern for p in self._patterns if p.match(nation)]
+
+    def stats(self) -> dict[str, FilterStats]:
+        return {pattern: replace(stats) for pattern, stats in self._stats.items()}
@@ -0,0 +1,122 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+from typing import Iterable, Iterator, Optional, TextIO
+
+logger = logging.getLogger("main")
+
+JOURNAL_PATH = "queue_journal.{}.jsonl"
+
+
+class Journal:
+    """append-only record of the queue operations applied since the last snapshot, one JSON array per line.
+
+    the journal is split into generations. taking a snapshot starts a new generation, and once the snapshot is safely on
+    disk every older generation can be deleted, so recovery replays the snapshot followed by at most a couple of
+    generations. lines are written through to the OS as soon as they are appended, so a killed process loses nothing"""
+
+    _pattern: str
+    "path of a generation, formatted with its number"
+    _generation: int
+    _file: Optional[TextIO]
+    _written: int
+    "bytes appended since the journal was opened"
+    _lock: threading.Lock
+    "records are appended from the feed and from every channel's handouts"
+
+    def __init__(self, pattern: str = JOURNAL_PATH):
+        self._pattern = pattern
+        self._generation = 0
+        self._file = None
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<Journal generation={self._generation} written={self._written}>"
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def generations(self) -> list[int]:
+        "generations present on disk, oldest first"
+        prefix, _, suffix = self._pattern.partition("{}")
+        found = []
+
+        for path in glob.glob(glob.escape(prefix) + "*" + glob.escape(suffix)):
+            number = path[len(prefix) : len(path) - len(suffix)]
+
+            if re.fullmatch(r"\d+", number):
+                found.append(int(number))
+
+        return sorted(found)
+
+    def _open(self, generation: int):
+        self._close()
+        self._generation = generation
+        self._file = open(self._pattern.format(generation), "a", encoding="utf-8")
+
+    def rotate(self) -> int:
+        "start a generation newer than any on disk and return its number"
+        with self._lock:
+            self._open(max([self._generation, *self.generations()]) + 1)
+
+            return self._generation
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, records: Iterable[list]):
+        if self._file is None:
+            return
+
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+
+        if not data:
+            return
+
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._file.write(data)
+            self._file.flush()
+            self._written += len(data)
+
+    def discard_before(self, generation: int):
+        for number in self.generations():
+            if number >= generation:
+                break
+
+            try:
+                os.remove(self._pattern.format(number))
+            except OSError as e:
+                logger.warning("Failed to remove journal generation %d: %s", number, e)
+
+    def replay(self, since: int = 0) -> Iterator[list]:
+        "records of every generation from since onwards, in the order they were appended"
+        for number in self.generations():
+            if number < since:
+                continue
+
+            with open(self._pattern.format(number), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # only the last line can be torn, by a crash in the middle of a write
+                        logger.warning("Stopping replay of journal generation %d at a torn record.", number)
+                        break
@@ -0,0 +1,329 @@
+"""Versioned schema migrations, applied in order at startup, and an EXPLAIN check of the bot's queries.
+
+Each migration is recorded in schema_migrations once all of its steps have run. MySQL commits DDL as it goes, so a
+migration cannot be rolled back as a whole; instead every step is safe to run again, which lets a migration that was
+interrupted, or a change that was made by hand before migrations existed, simply be applied over:
+
+    uv run -m components.migrations
+    uv run -m components.migrations check
+"""
+
+import ast
+import asyncio
+import inspect
+import logging
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import ModuleType
+from typing import Awaitable, Callable, List
+
+import aiomysql
+
+from components.telegrams import REBUILD_DAILY, REBUILD_STREAKS
+
+logger = logging.getLogger("main")
+
+LOCK_NAME = "recruitment_tool_migrations"
+LOCK_TIMEOUT = 300
+"seconds to wait for another instance to finish migrating"
+
+Step = Callable[[aiomysql.Cursor], Awaitable[None]]
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    steps: List[Step]
+
+
+@dataclass
+class ScanWarning:
+    query: str
+    "first line of the query"
+    table: str
+    type: str
+    "EXPLAIN access type, ALL for a full table scan and index for a full index scan"
+    rows: int
+    "rows the optimizer expects to read"
+
+
+def sql(statement: str) -> Step:
+    async def step(cur: aiomysql.Cursor):
+        await cur.execute(statement)
+
+    return step
+
+
+def add_column(table: str, column: str, definition: str) -> Step:
+    async def step(cur: aiomysql.Cursor):
+        await cur.execute(
+            "SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s;",
+            (table, column),
+        )
+
+        if not await cur.fetchone():
+            await cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+    return step
+
+
+def add_index(table: str, name: str, columns: List[str]) -> Step:
+    "add an index, unless one already starts with the same columns"
+
+    async def step(cur: aiomysql.Cursor):
+        await cur.execute(
+            """SELECT INDEX_NAME, COLUMN_NAME
+               FROM information_schema.STATISTICS
+               WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = %s
+               ORDER BY INDEX_NAME, SEQ_IN_INDEX;""",
+            (table,),
+        )
+        indexes: dict[str, List[str]] = {}
+
+        for index_name, column in await cur.fetchall():
+            indexes.setdefault(index_name, []).append(column)
+
+        if not any(existing[: len(columns)] == columns for existing in indexes.values()):
+            await cur.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)});")
+
+    return step
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "base schema",
+        [
+            sql(
+                """CREATE TABLE IF NOT EXISTS recruitment_channels (
+                       id        INT AUTO_INCREMENT PRIMARY KEY,
+                       serverId  BIGINT  NOT NULL,
+                       channelId BIGINT  NOT NULL UNIQUE,
+                       messageId BIGINT  NOT NULL,
+                       disabled  BOOLEAN NOT NULL DEFAULT FALSE
+                   );"""
+            ),
+            sql(
+                """CREATE TABLE IF NOT EXISTS exceptions (
+                       channelId INT         NOT NULL,
+                       region    VARCHAR(50) NOT NULL,
+                       PRIMARY KEY (channelId, region)
+                   );"""
+            ),
+            sql("CREATE TABLE IF NOT EXISTS global_exceptions (region VARCHAR(50) PRIMARY KEY);"),
+            sql("CREATE TABLE IF NOT EXISTS whitelist (id INT AUTO_INCREMENT PRIMARY KEY, serverId BIGINT NOT NULL UNIQUE);"),
+            sql("CREATE TABLE IF NOT EXISTS filters (pattern VARCHAR(255) PRIMARY KEY);"),
+            sql(
+                """CREATE TABLE IF NOT EXISTS users (
+                       id                 INT AUTO_INCREMENT PRIMARY KEY,
+                       discordId          BIGINT      NOT NULL,
+                       nation             VARCHAR(40) NOT NULL,
+                       recruitTemplate    VARCHAR(20) NOT NULL,
+                       sessionLength      INT         NOT NULL,
+                       foundedTime        DATETIME    NOT NULL,
+                       allowRecruitmentAt DATETIME    NULL,
+                       channelId          INT         NULL
+                   );"""
+            ),
+            sql(
+                """CREATE TABLE IF NOT EXISTS telegrams (
+                       id          INT AUTO_INCREMENT PRIMARY KEY,
+                       recruiterId INT      NOT NULL,
+                       nationCount INT      NOT NULL,
+                       channelId   INT      NULL,
+                       timestamp   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                   );"""
+            ),
+        ],
+    ),
+    Migration(
+        2,
+        "filter statistics and per-channel max age",
+        [
+            add_column("filters", "evaluations", "BIGINT NOT NULL DEFAULT 0"),
+            add_column("filters", "hits", "BIGINT NOT NULL DEFAULT 0"),
+            add_column("filters", "matchTime", "DOUBLE NOT NULL DEFAULT 0"),
+            add_column("filters", "maxMatchTime", "DOUBLE NOT NULL DEFAULT 0"),
+            add_column("recruitment_channels", "maxAge", "INT NULL"),
+        ],
+    ),
+    Migration(
+        3,
+        "daily telegram rollup and streaks, backfilled from telegrams",
+        [
+            sql(
+                """CREATE TABLE IF NOT EXISTS telegram_daily (
+                       channelId   INT  NOT NULL,
+                       recruiterId INT  NOT NULL,
+                       day         DATE NOT NULL,
+                       nationCount INT  NOT NULL,
+                       PRIMARY KEY (channelId, day, recruiterId)
+                   );"""
+            ),
+            sql(
+                """CREATE TABLE IF NOT EXISTS telegram_streaks (
+                       id          INT AUTO_INCREMENT PRIMARY KEY,
+                       channelId   INT  NOT NULL,
+                       recruiterId INT  NOT NULL,
+                       startDay    DATE NOT NULL,
+                       lastDay     DATE NOT NULL,
+                       INDEX telegram_streaks_range (channelId, lastDay),
+                       INDEX telegram_streaks_recruiter (channelId, recruiterId, lastDay)
+                   );"""
+            ),
+            sql("DELETE FROM telegram_daily;"),
+            sql(REBUILD_DAILY),
+            sql("DELETE FROM telegram_streaks;"),
+            sql(REBUILD_STREAKS),
+        ],
+    ),
+    Migration(
+        4,
+        "indexes for recruiter lookups, channel lookups, reports and exceptions",
+        [
+            # covering for the recruiter id lookup, as secondary indexes carry the primary key
+            add_index("users", "users_recruiter", ["discordId", "channelId"]),
+            add_index("recruitment_channels", "recruitment_channels_enabled", ["channelId", "disabled"]),
+            # covering for the partial days that reports read around the rollup
+            add_index("telegrams", "telegrams_channel_time", ["channelId", "timestamp", "recruiterId", "nationCount"]),
+            add_index("exceptions", "exceptions_channel", ["channelId", "region"]),
+        ],
+    ),
+]
+
+
+async def migrate(pool: aiomysql.Pool, migrations: List[Migration] = MIGRATIONS) -> int:
+    "apply every migration newer than the database, returning the schema version it ends up at"
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT GET_LOCK(%s, %s);", (LOCK_NAME, LOCK_TIMEOUT))
+
+            if (await cur.fetchone())[0] != 1:
+                raise Exception("Timed out waiting for another instance to finish migrating the schema")
+
+            try:
+                await cur.execute(
+                    """CREATE TABLE IF NOT EXISTS schema_migrations (
+                           version     INT PRIMARY KEY,
+                           description VARCHAR(200) NOT NULL,
+                           appliedAt   DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP
+                       );"""
+                )
+                await cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations;")
+                (version,) = await cur.fetchone()
+
+                if version > migrations[-1].version:
+                    logger.warning("Schema version %d is newer than this build knows about (%d).", version, migrations[-1].version)
+
+                for migration in migrations:
+                    if migration.version <= version:
+                        continue
+
+                    logger.info("Applying schema migration %d: %s.", migration.version, migration.description)
+
+                    for step in migration.steps:
+                        await step(cur)
+
+                    await cur.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s);", (migration.version, migration.description)
+                    )
+                    version = migration.version
+            finally:
+                await cur.execute("SELECT RELEASE_LOCK(%s);", (LOCK_NAME,))
+
+    return version
+
+
+def queries(module: ModuleType) -> List[str]:
+    "the SELECT, UPDATE and DELETE statements a module passes to execute, by literal or by the name of a constant"
+    found = []
+
+    for node in ast.walk(ast.parse(inspect.getsource(module))):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ("execute", "executemany")):
+            continue
+
+        if not node.args:
+            continue
+
+        argument = node.args[0]
+
+        if isinstance(argument, ast.Constant) and isinstance(argument.value, str):
+            query = argument.value
+        elif isinstance(argument, ast.Name) and isinstance(getattr(module, argument.id, None), str):
+            query = getattr(module, argument.id)
+        else:
+            continue
+
+        if query.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "UPDATE", "DELETE"):
+            found.append(query)
+
+    return found
+
+
+async def check(pool: aiomysql.Pool, module: ModuleType) -> List[ScanWarning]:
+    """EXPLAIN every query of a module and return the tables each would read in full.
+
+    every placeholder is bound to the current time. MySQL converts a constant to the type of the column it is compared
+    against, so the access type is the one real parameters get, even if the row estimates are not"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    warnings = []
+
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            for query in queries(module):
+                await cur.execute(f"EXPLAIN {query}", (now,) * query.count("%s"))
+
+                for row in await cur.fetchall():
+                    # derived tables and union results are read in full by design, their sources are listed separately
+                    if row["type"] in ("ALL", "index") and row["table"] and not row["table"].startswith("<"):
+                        warnings.append(ScanWarning(query.strip().splitlines()[0], row["table"], row["type"], row["rows"] or 0))
+
+    return warnings
+
+
+async def run(command: str) -> int:
+    "run a command against the configured database, returning the number of full scans found"
+    from components.config.config_manager import configInstance
+
+    pool = await aiomysql.create_pool(
+        host=configInstance.data.db_host,
+        port=configInstance.data.db_port,
+        user=configInstance.data.db_user,
+        password=configInstance.data.db_password,
+        db=configInstance.data.db_name,
+        autocommit=True,
+        init_command="SET SESSION time_zone='+00:00'",
+    )
+
+    try:
+        if command == "check":
+            import components.bot
+
+            warnings = await check(pool, components.bot)
+
+            for warning in warnings:
+                kind = "full table scan" if warning.type == "ALL" else "full index scan"
+                print(f"{kind} of {warning.table} (~{warning.rows} rows): {warning.query}")
+
+            print(f"{len(warnings)} full scans in {len(queries(components.bot))} queries")
+
+            return len(warnings)
+
+        print(f"schema is at version {await migrate(pool)}")
+
+        return 0
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+
+def main():
+    if asyncio.run(run(sys.argv[1] if len(sys.argv) > 1 else "migrate")):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger("main")
+
+FOUNDING_REGEX = re.compile("^@@([a-z0-9_]+)@@ was founded in %%([a-z0-9_]+)%%.?$")
+MOVE_REGEX = re.compile("^@@([a-z0-9_]+)@@ relocated from %%([a-z0-9_]+)%% to %%([a-z0-9_]+)%%.?$")
+
+FOUNDING_MARKER = "was founded in"
+MOVE_MARKER = "relocated from"
+
+
+@dataclass(slots=True)
+class FoundingEvent:
+    nation: str
+    region: str
+    timestamp: int
+    "unix time of the founding"
+    id: str = ""
+
+
+@dataclass(slots=True)
+class MoveEvent:
+    nation: str
+    moved_from: str
+    moved_to: str
+    timestamp: int
+    "unix time of the move"
+    id: str = ""
+
+
+def _string_field(data: str, key: str) -> Optional[str]:
+    """the value of a top level string field, read without decoding the rest of the payload. returns None when the field
+    is missing or contains escapes, in which case the caller falls back to a full decode"""
+    colon = data.find(f'"{key}":')
+
+    if colon == -1:
+        return None
+
+    colon += len(key) + 3
+    start = data.find('"', colon)
+    end = data.find('"', start + 1)
+
+    if start == -1 or end == -1 or data[colon:start].strip():
+        return None
+
+    value = data[start + 1 : end]
+
+    if "\\" in value:
+        return None
+
+    return value
+
+
+def _int_field(data: str, key: str) -> Optional[int]:
+    start = data.find(f'"{key}":')
+
+    if start == -1:
+        return None
+
+    start += len(key) + 3
+    end = min((i for i in (data.find(",", start), data.find("}", start)) if i != -1), default=-1)
+
+    # a number running to the end of the payload may have been cut short
+    if end == -1:
+        return None
+
+    try:
+        return int(data[start:end].strip().strip('"'))
+    except ValueError:
+        return None
+
+
+def _fields(data: str) -> Optional[tuple[str, str, int]]:
+    "the str, id and time fields of an event, skipping htmlStr"
+    text = _string_field(data, "str")
+    event_id = _string_field(data, "id")
+    timestamp = _int_field(data, "time")
+
+    if text is not None and event_id is not None and timestamp is not None:
+        return text, event_id, timestamp
+
+    try:
+        decoded = json.loads(data)
+        return decoded["str"], str(decoded["id"]), int(decoded["time"])
+    except (ValueError, KeyError, TypeError) as e:
+        logger.debug("skipping malformed event: %s", e)
+        return None
+
+
+def parse(data: str) -> Optional[FoundingEvent | MoveEvent]:
+    """turn the data of a founding+move feed event into a founding or move record.
+
+    events are dispatched on a plain substring check before anything is decoded, so events that are neither foundings
+    nor moves cost a single scan"""
+    if FOUNDING_MARKER in data:
+        regex = FOUNDING_REGEX
+    elif MOVE_MARKER in data:
+        regex = MOVE_REGEX
+    else:
+        return None
+
+    if (fields := _fields(data)) is None:
+        return None
+
+    text, event_id, timestamp = fields
+
+    if (match := regex.match(text)) is None:
+        return None
+
+    if regex is FOUNDING_REGEX:
+        return FoundingEvent(match[1], match[2], timestamp, event_id)
+
+    return MoveEvent(match[1], match[2], match[3], timestamp, event_id)
@@ -1,246 +1,1035 @@
 import asyncio
+import heapq
 import json
 import logging
+import math
+import os
 import re
+import sys
 import threading
 import time
-from contextlib import AbstractAsyncContextManager
-from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
-from typing import List, Self
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import AbstractAsyncContextManager, AbstractContextManager, ExitStack, nullcontext
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional
 
 import aiomysql
 import discord
 import httpx
-from httpx_sse import ServerSentEvent, connect_sse
-from stamina import retry
+from discord import app_commands
+from httpx_sse import ServerSentEvent, aconnect_sse, connect_sse
+from stamina import retry, retry_context
 
+from components.channel import RecruitmentChannel
 from components.errors import EmptyQueue
+from components.filters import FilterEngine, FilterStats
+from components.journal import JOURNAL_PATH, Journal
+from components.snapshot import Snapshot, write as write_snapshot
+from components.parser import FoundingEvent, MoveEvent, parse
 
 logger = logging.getLogger("main")
 
 PUPPET_REGEX = re.compile(r"^\d+_[a-z0-9_]+|[a-z0-9_]+_\d+$|^[a-z0-9_]+_m{0,4}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})$")
-FOUNDING_REGEX = re.compile("^@@([a-z0-9_]+)@@ was founded in %%([a-z0-9_]+)%%.?$")
-MOVE_REGEX = re.compile("^@@([a-z0-9_]+)@@ relocated from %%([a-z0-9_]+)%% to %%([a-z0-9_]+)%%.?$")
 
 HEADERS = {}
 
+MAX_AGE = 3600
+"seconds a founding stays in a queue, unless the channel sets its own max age"
 
-@dataclass
-class Event:
-    id: str
-    htmlstr: str
-    str: str
-    timestamp: int
+BUCKET_SECONDS = 60
+"width of the time buckets foundings expire in, and the interval of the background expiry tick"
 
-    @classmethod
-    def from_json(cls, dct) -> Self:
-        return cls(dct["id"], dct["htmlStr"], dct["str"], int(dct["time"]))
+QUEUE_CAP = 10_000
+"most nations a queue holds before its oldest are evicted"
 
-    def __repr__(self):
-        return f"<Event id={self.id} data={self.str}>"
+MEMORY_BUDGET = 128 * 1024 * 1024
+"estimated bytes the queues may use before the oldest nations are evicted from idle channels"
+
+IDLE_AFTER = 900
+"seconds without a handout after which a channel is idle, and evicted from first when over the memory budget"
+
+FOUNDING_BYTES = 90
+"estimated cost of a founding beyond its name: its entries in the log columns and in the name index"
+RANGE_BYTES = 136
+"estimated cost of one of a queue's ranges"
+SKIPPED_BYTES = 60
+"estimated cost of one of a queue's skipped sequence numbers"
+
+FEED_URL = "https://www.nationstates.net/api/founding+move"
+
+INGESTION_MODES = ("thread", "async")
+"""thread: the feed is read by a blocking client on a daemon thread, and queue mutations are guarded by locks.
+async: the feed is read by an asyncio task on the bot's loop, so no locking is needed"""
+
+COMPACT_INTERVAL = 60
+"seconds between background compactions of the queues"
+
+FILTER_STATS_INTERVAL = 300
+"seconds between saves of the per-pattern filter statistics"
+
+SNAPSHOT_INTERVAL = 300
+"seconds between background snapshots of the queue state, which bound how much journal is replayed at startup"
+
+STATE_PATH = "queue_state.bin"
+LEGACY_STATE_PATH = "queue_state.json"
+"JSON queue state written by earlier versions, converted into a snapshot at startup"
+
+SEEN_EVENT_IDS = 10_000
+"number of recent event ids remembered, so events the feed replays after a reconnect are not queued twice"
 
 
 @dataclass
-class FoundingEvent:
-    nation: str
-    region: str
-    timestamp: datetime
+class BatchStats:
+    batches: int = 0
+    events: int = 0
+    max_size: int = 0
+    latency: float = 0.0
+    "cumulative seconds between events being received and their batch being applied"
+    max_latency: float = 0.0
+
+    @property
+    def mean_size(self) -> float:
+        return self.events / self.batches if self.batches else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency / self.events if self.events else 0.0
 
 
 @dataclass
-class MoveEvent:
-    nation: str
-    moved_from: str
-    moved_to: str
-    timestamp: datetime
+class Handout:
+    "nations taken from a queue that are only gone for good once the recruiter's claim on them is committed"
+
+    channel_id: int
+    seqs: List[int]
+    names: List[str]
 
 
 @dataclass
+class QueueUsage:
+    channel_id: int
+    nations: int
+    estimated_bytes: int
+    "the nations this queue holds at the log's average cost per founding, plus the queue's own bookkeeping"
+    idle_for: float
+    "seconds since this queue last handed out nations"
+
+
+@dataclass(slots=True)
 class Nation:
     name: str
     region: str
-    founding_time: datetime
+    founding_time: int
+    "unix time of the founding"
+
+
+class FoundingLog:
+    """time-ordered log of foundings shared by every queue. each founding is stored once and addressed by a sequence number.
+
+    the log is a ring buffer over parallel columns: nation names, region ids into an intern table, and founding times as
+    epoch seconds, so a founding costs its name and a few machine words rather than a Nation object. expired nations are
+    dropped by advancing the start sequence number, and the dead prefix of the columns is only released once it makes up
+    half of the log, so appends, lookups and pruning are all O(1) amortized.
+
+    start and end only ever move forward and can be read from any thread. reading the columns has to be serialized with
+    expire, which shifts them when it releases the dead prefix"""
+
+    _names: List[str]
+    _regions: array
+    "index of each founding's region in _region_names"
+    _times: array
+    "founding times, in epoch seconds"
+    _region_names: List[str]
+    _region_ids: dict[str, int]
+    "intern table of every region seen, which repeat across thousands of foundings"
+    _offset: int
+    "sequence number of the first entry in the columns, which may already have expired"
+    _start: int
+    "sequence number of the oldest nation still held in the log"
+    _end: int
+    "sequence number of the next founding, only advanced once a founding is in every column"
+    _index: dict[str, int]
+    "nation name to the sequence number of its latest founding"
+    _buckets: deque[List[int]]
+    "[bucket, sequence number of its first founding] for each time bucket still in the log, oldest first"
+    _name_bytes: int
+    "size of every name still in the log"
+    _last_updated: datetime
+
+    def __init__(self):
+        self._names = []
+        self._regions = array("I")
+        self._times = array("q")
+        self._region_names = []
+        self._region_ids = {}
+        self._offset = 0
+        self._start = 0
+        self._end = 0
+        self._index = {}
+        self._buckets = deque()
+        self._name_bytes = 0
+        self._last_updated = datetime.now(timezone.utc)
+
+    def __repr__(self):
+        return f"<FoundingLog start={self._start} nations={len(self)} regions={len(self._region_names)}>"
+
+    def __getitem__(self, seq: int) -> Nation:
+        i = seq - self._offset
+
+        return Nation(self._names[i], self._region_names[self._regions[i]], self._times[i])
+
+    def __len__(self) -> int:
+        return self.end - self._start
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def end(self) -> int:
+        "sequence number that will be assigned to the next founding"
+        return self._end
+
+    @property
+    def last_updated(self):
+        return self._last_updated
+
+    @property
+    def estimated_bytes(self) -> int:
+        return len(self) * FOUNDING_BYTES + self._name_bytes
+
+    @property
+    def bytes_per_nation(self) -> float:
+        return self.estimated_bytes / len(self) if len(self) else FOUNDING_BYTES
+
+    def name(self, seq: int) -> str:
+        return self._names[seq - self._offset]
+
+    def region(self, seq: int) -> str:
+        return self._region_names[self._regions[seq - self._offset]]
+
+    def founding_time(self, seq: int) -> int:
+        return self._times[seq - self._offset]
+
+    def _region_id(self, region: str) -> int:
+        if (region_id := self._region_ids.get(region)) is None:
+            region_id = self._region_ids[region] = len(self._region_names)
+            self._region_names.append(region)
+
+        return region_id
+
+    def append(self, nation: Nation) -> int:
+        seq = self.end
+
+        self._names.append(nation.name)
+        self._regions.append(self._region_id(nation.region))
+        self._times.append(nation.founding_time)
+        self._index[nation.name] = seq
+        self._name_bytes += sys.getsizeof(nation.name)
+        self._last_updated = datetime.now(timezone.utc)
+        self._end = seq + 1
+
+        # foundings that arrive out of order join the newest bucket, so they expire slightly late rather than early
+        bucket = nation.founding_time // BUCKET_SECONDS
+
+        if not self._buckets or bucket > self._buckets[-1][0]:
+            self._buckets.append([bucket, seq])
+
+        return seq
+
+    def lookup(self, nation_name: str) -> Optional[int]:
+        "sequence number of the nation's latest founding, if it is still in the log"
+        return self._index.get(nation_name)
+
+    def boundary(self, max_age: int = MAX_AGE, now: Optional[int] = None) -> int:
+        "the first sequence number whose time bucket is not yet entirely older than max_age"
+        cutoff = (int(time.time()) if now is None else now) - max_age
+        index = bisect_left(self._buckets, cutoff // BUCKET_SECONDS, key=lambda b: b[0])
+
+        return self._buckets[index][1] if index < len(self._buckets) else self.end
+
+    def expire(self, start: int):
+        "drop every nation before the given sequence number"
+        start = min(start, self.end)
+
+        while self._start < start:
+            name = self._names[self._start - self._offset]
+
+            if self._index.get(name) == self._start:
+                del self._index[name]
+
+            self._name_bytes -= sys.getsizeof(name)
+
+            self._start += 1
+
+        while len(self._buckets) > 1 and self._buckets[1][1] <= start:
+            self._buckets.popleft()
+
+        if self._buckets and self._buckets[0][1] < start:
+            self._buckets[0][1] = start
+
+        self._compact()
+
+    def _compact(self):
+        dead = self._start - self._offset
+
+        if dead and dead * 2 >= len(self._names):
+            del self._names[:dead]
+            del self._regions[:dead]
+            del self._times[:dead]
+            self._offset = self._start
+
+    def purge(self):
+        self._start = self.end
+        self._index = {}
+        self._buckets = deque()
+        self._name_bytes = 0
+        self._compact()
+
+    def restore(self, start: int, nations: Iterable[Nation]):
+        "reset the log to the given nations, numbered from start"
+        self._names = []
+        self._regions = array("I")
+        self._times = array("q")
+        self._offset = start
+        self._start = start
+        self._end = start
+        self._index = {}
+        self._buckets = deque()
+        self._name_bytes = 0
+
+        for nation in nations:
+            self.append(nation)
+
+
+def _return_to(ranges: deque[List[int]], seq: int):
+    "put a sequence number back into [start, end) ranges that do not hold it, joining it to the ranges either side"
+    index = bisect_right(ranges, seq, key=lambda r: r[0]) - 1
+
+    if index >= 0 and ranges[index][1] == seq:
+        ranges[index][1] = seq + 1
+
+        if index + 1 < len(ranges) and ranges[index + 1][0] == seq + 1:
+            ranges[index][1] = ranges[index + 1][1]
+            del ranges[index + 1]
+    elif index + 1 < len(ranges) and ranges[index + 1][0] == seq + 1:
+        ranges[index + 1][0] = seq
+    else:
+        ranges.insert(index + 1, [seq, seq + 1])
 
 
 class Queue:
-    _whitelist: list[str]
-    "list of regions that the region associated with this queue will not recruit from"
-    _nations: List[Nation]
+    """a channel's view of the shared founding log.
+
+    the queue holds no nations of its own, only the ranges of log sequence numbers it has not handed out yet, the
+    foundings newer than its cursor, and the sequence numbers it must skip because of its whitelist. new foundings are
+    picked up in O(1), handing out k nations costs O(k) and expiry costs O(expired ranges)"""
+
+    _log: FoundingLog
+    _whitelist: set[str]
+    "set of regions that the region associated with this queue will not recruit from"
+    _ranges: deque[List[int]]
+    "[start, end) ranges of sequence numbers that have not been handed out, oldest first"
+    _ranged: int
+    "total length of _ranges"
+    _cursor: int
+    "every founding at or after this sequence number is available to this queue"
+    _skipped: set[int]
+    "available sequence numbers that must not be handed out"
+    _clipped_at: int
+    "first sequence number at the last clip"
+    _max_age: int
+    "seconds a founding stays in this queue"
+    _horizon: int
+    "sequence number this queue has expired up to, which runs ahead of the log start when its max age is the shorter"
+    _last_handout: float
+    "monotonic time of the last handout, or of the queue's creation"
+    _held: dict[int, bool]
+    "sequence numbers taken by a handout that is not claimed yet, and whether they were skipped while out"
     _last_updated: datetime
-
-    def __init__(self, whitelist=None):
+    _edits: int
+    "changes made by the queue itself, as opposed to foundings arriving and expiring from the log"
+    lock: AbstractContextManager
+    "held while this queue is read or changed. taken before the log lock, never after it"
+
+    def __init__(
+        self,
+        log: FoundingLog,
+        whitelist: Optional[Iterable[str]] = None,
+        max_age: int = MAX_AGE,
+        lock: Optional[AbstractContextManager] = None,
+    ):
         if whitelist is None:
             whitelist = []
-        self._nations = []
-        self._whitelist = whitelist
+        self.lock = threading.Lock() if lock is None else lock
+        self._log = log
+        self._whitelist = set(whitelist)
+        self._max_age = max_age
+        self._horizon = log.start
+        self._last_handout = time.monotonic()
+        self._held = {}
+        self._ranges = deque()
+        self._ranged = 0
+        self._cursor = log.end
+        self._skipped = set()
+        self._clipped_at = log.start
         self._last_updated = datetime.now(timezone.utc)
+        self._edits = 0
 
     def __repr__(self):
-        return f"<Queue nations={len(self._nations)}>"
+        return f"<Queue nations={self.get_nation_count()}>"
+
+    @property
+    def first(self) -> int:
+        "the oldest sequence number that has not expired from this queue"
+        return max(self._log.start, self._horizon)
+
+    @property
+    def version(self) -> tuple[int, int, int]:
+        """changes whenever the nation count or last update of this queue may have. reads no state that needs the lock, so
+        an unchanged queue can be told apart without taking it"""
+        return self._log.end, self.first, self._edits
+
+    def _clip(self):
+        "drop the parts of this queue that have expired, out of the log or past this queue's max age"
+        start = self.first
+
+        if start == self._clipped_at:
+            return
+
+        self._clipped_at = start
+
+        if self._cursor < start:
+            self._cursor = start
+
+        while self._ranges and self._ranges[0][1] <= start:
+            lo, hi = self._ranges.popleft()
+            self._ranged -= hi - lo
+
+        if self._ranges and self._ranges[0][0] < start:
+            self._ranged -= start - self._ranges[0][0]
+            self._ranges[0][0] = start
+
+        if self._skipped and min(self._skipped) < start:
+            self._skipped = {seq for seq in self._skipped if seq >= start}
 
-    def update(self, nation: Nation):
-        if nation.region not in self._whitelist:
-            self._nations.insert(0, nation)
+    def _absorb(self):
+        "move foundings past the cursor into the ranges so that they can be handed out"
+        end = self._log.end
+
+        if self._cursor == end:
+            return
+
+        if self._ranges and self._ranges[-1][1] == self._cursor:
+            self._ranges[-1][1] = end
+        else:
+            self._ranges.append([self._cursor, end])
+
+        self._ranged += end - self._cursor
+        self._cursor = end
+
+    def _is_available(self, seq: int) -> bool:
+        if seq >= self._cursor:
+            return seq < self._log.end
+
+        index = bisect_right(self._ranges, seq, key=lambda r: r[0]) - 1
+
+        return index >= 0 and seq < self._ranges[index][1]
+
+    def _available(self) -> Iterator[int]:
+        "sequence numbers that can be handed out, newest first"
+        for seq in range(self._log.end - 1, self._cursor - 1, -1):
+            if seq not in self._skipped:
+                yield seq
+
+        for lo, hi in reversed(self._ranges):
+            for seq in range(hi - 1, lo - 1, -1):
+                if seq not in self._skipped:
+                    yield seq
 
     def get_nation_count(self) -> int:
-        return len(self._nations)
+        self._clip()
 
-    def get_nations(self, user: discord.User, return_count: int = 8) -> List[str]:
-        self.prune()
+        return self._ranged + self._log.end - self._cursor - len(self._skipped)
+
+    def take(self, user: discord.User, return_count: int = 8) -> List[int]:
+        "hand out up to return_count of the newest nations, returning their sequence numbers"
+        self._last_handout = time.monotonic()
 
         if self.get_nation_count() == 0:
             raise EmptyQueue(user)
 
-        resp = [nation.name for nation in self._nations][:return_count]
+        self._absorb()
+
+        resp = []
+
+        while self._ranges and len(resp) < return_count:
+            lo, hi = self._ranges[-1]
+
+            while hi > lo and len(resp) < return_count:
+                hi -= 1
+                self._ranged -= 1
+
+                if hi in self._skipped:
+                    self._skipped.discard(hi)
+                else:
+                    resp.append(hi)
 
-        self._nations = self._nations[return_count:]
+            if hi == lo:
+                self._ranges.pop()
+            else:
+                self._ranges[-1][1] = hi
+
+        self._edits += 1
 
         return resp
 
+    def hold(self, user: discord.User, return_count: int = 8) -> List[int]:
+        "take nations as take does, but keep track of them until they are claimed or given back"
+        seqs = self.take(user, return_count)
+        self._held.update(dict.fromkeys(seqs, False))
+
+        return seqs
+
+    def claim(self, seqs: Iterable[int]):
+        for seq in seqs:
+            self._held.pop(seq, None)
+
+    def give_back(self, seqs: Iterable[int]):
+        "return held nations to the queue, unless they expired or were skipped while they were out"
+        self._clip()
+
+        for seq in sorted(seqs):
+            if self._held.pop(seq, True) or seq < self.first:
+                continue
+
+            _return_to(self._ranges, seq)
+            self._ranged += 1
+            self._edits += 1
+
     def get_nation_names(self) -> List[str]:
-        return [nation.name for nation in self._nations]
+        self._clip()
+
+        return [self._log.name(seq) for seq in self._available()]
 
     def snapshot(self) -> List[Nation]:
-        return list(self._nations)
+        self._clip()
+
+        return [self._log[seq] for seq in self._available()]
+
+    def restore(self, seqs: Iterable[int]):
+        "reset this queue to the given log sequence numbers, skipping foundings in whitelisted regions"
+        self.purge()
+
+        for seq in sorted(seqs):
+            if self._log.region(seq) in self._whitelist:
+                continue
+
+            if self._ranges and self._ranges[-1][1] == seq:
+                self._ranges[-1][1] = seq + 1
+            elif not self._ranges or self._ranges[-1][1] < seq:
+                self._ranges.append([seq, seq + 1])
+            else:
+                continue
 
-    def restore(self, nations: List[Nation]):
-        self._nations.extend(n for n in nations if n.region not in self._whitelist)
+            self._ranged += 1
 
-    def prune(self):
-        current_time = datetime.now(timezone.utc)
+    def state(self) -> dict:
+        """the sequence numbers this queue can hand out, in a form that can be saved alongside the log.
+
+        held nations are saved as still queued. a handout that is committed later is journaled and replayed on top, and
+        one that is given back, or never settled before a restart, leaves them in the queue"""
+        self._clip()
+
+        ranges = deque([lo, hi] for lo, hi in self._ranges)
+
+        for seq in sorted(seq for seq, skipped in self._held.items() if not skipped and seq >= self.first):
+            _return_to(ranges, seq)
+
+        return {"ranges": list(map(list, ranges)), "cursor": self._cursor, "skipped": sorted(self._skipped)}
+
+    def load_state(self, state: dict):
+        "reset this queue to a state returned by state(), against a log restored with the same sequence numbers"
+        self._ranges = deque([lo, hi] for lo, hi in state["ranges"])
+        self._ranged = sum(hi - lo for lo, hi in self._ranges)
+        self._cursor = state["cursor"]
+        self._skipped = set(state["skipped"])
+        self._clipped_at = -1
+        self._edits += 1
+        self._clip()
+
+    def expire(self, boundary: int):
+        "drop every founding before the boundary from this queue"
+        if boundary > self._horizon:
+            self._horizon = boundary
+            self._clip()
+
+    def evict(self, count: int):
+        "drop the count oldest nations this queue could hand out"
+        self._clip()
+        self._absorb()
+
+        for lo, hi in self._ranges:
+            for seq in range(lo, hi):
+                if seq in self._skipped:
+                    continue
 
-        self._nations = [nation for nation in self._nations if (current_time - nation.founding_time).total_seconds() < 3600]
+                if count == 0:
+                    self.expire(seq)
+                    return
+
+                count -= 1
+
+        self.expire(self._log.end)
+
+    def estimated_bytes(self) -> int:
+        "the queue's own bookkeeping, not counting the log"
+        return len(self._ranges) * RANGE_BYTES + len(self._skipped) * SKIPPED_BYTES
+
+    def idle_for(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self._last_handout
+
+    def compact(self) -> bool:
+        """drop skipped sequence numbers from the ranges so that they no longer have to be stepped over at handout time.
+
+        a skipped number inside a range splits it in two, and a range costs more than a skipped number, so this is only
+        done when the ranges that result cost less than the ranges and skipped set they replace. returns whether it was"""
+        self._clip()
+        self._absorb()
+
+        if not self._skipped:
+            return False
+
+        skipped = sorted(self._skipped)
+        ranges: deque[List[int]] = deque()
+        i = 0
+
+        for lo, hi in self._ranges:
+            while i < len(skipped) and skipped[i] < hi:
+                if skipped[i] > lo:
+                    ranges.append([lo, skipped[i]])
+
+                lo = skipped[i] + 1
+                i += 1
+
+            if lo < hi:
+                ranges.append([lo, hi])
+
+        if len(ranges) * RANGE_BYTES >= self.estimated_bytes():
+            return False
+
+        self._ranges = ranges
+        self._ranged -= len(self._skipped)
+        self._skipped = set()
+
+        return True
 
     def purge(self):
-        self._nations = []
+        self._ranges = deque()
+        self._ranged = 0
+        self._cursor = self._log.end
+        self._skipped = set()
+        self._edits += 1
 
     def add_to_whitelist(self, region: str):
-        self._whitelist.append(region)
+        self._whitelist.add(region)
 
     def remove_from_whitelist(self, region: str):
-        self._whitelist.remove(region)
+        self._whitelist.discard(region)
+
+    def skip(self, seq: int) -> bool:
+        """stop the founding at seq from being handed out, if it still could be. returns whether it was taken out of the
+        queue, which a held founding already is"""
+        if seq in self._held:
+            self._held[seq] = True
+        elif seq >= self.first and seq not in self._skipped and self._is_available(seq):
+            self._skipped.add(seq)
+            self._edits += 1
+            return True
+
+        return False
 
     def handle_move(self, nation_name: str, destination: str):
         if destination in self._whitelist:
-            self._nations = [nation for nation in self._nations if nation.name != nation_name]
-
-            self._last_updated = datetime.now(timezone.utc)
+            seq = self._log.lookup(nation_name)
 
-    def handle_founding(self, nation: Nation):
-        if nation.region not in self._whitelist:
-            self._nations.insert(0, nation)
+            if seq is not None and self.skip(seq):
+                self._last_updated = datetime.now(timezone.utc)
 
-            self._last_updated = datetime.now(timezone.utc)
+    def handle_founding(self, seq: int, nation: Nation):
+        if nation.region in self._whitelist:
+            self._skipped.add(seq)
 
     @property
     def whitelist(self):
         return self._whitelist
 
+    @property
+    def max_age(self) -> int:
+        return self._max_age
+
+    @max_age.setter
+    def max_age(self, max_age: int):
+        "a longer max age only applies to foundings that have not expired from this queue yet"
+        self._max_age = max_age
+
     @property
     def last_updated(self):
-        return self._last_updated
+        return max(self._last_updated, self._log.last_updated)
 
 
 class QueueManager(AbstractAsyncContextManager):
-    _whitelist: List[str]
-    """list of regions from which spawns will be ignored globally. moves to these regions are also purged from all queues"""
+    _whitelist: set[str]
+    """set of regions from which spawns will be ignored globally. moves to these regions are also purged from all queues"""
     _pool: aiomysql.Pool
+    _channels: dict[int, RecruitmentChannel]
+    "every row of recruitment_channels, disabled or not, by discord channel id"
+    _log: FoundingLog
     _queues: dict[int, Queue] = field(default_factory=dict)
-    _queue_lock: threading.Lock
-    _filters: List[re.Pattern]
-    _filter_lock: threading.Lock
+    _excluded_by: dict[str, frozenset[int]]
+    "region to the channels whose whitelist contains it"
+    _registry_lock: AbstractContextManager
+    """serializes changes to the channel registry, _queues and _excluded_by. both are copied on write and swapped in
+    whole, so readers take a reference without locking and work against a consistent registry"""
+    _log_lock: AbstractContextManager
+    "held to append to the log, to expire it, and to read names out of it while it may be expiring"
+    _filters: FilterEngine
+    _filter_lock: AbstractContextManager
+    _pending: List[FoundingEvent | MoveEvent]
+    "parsed events waiting to be applied as one batch"
+    _pending_times: List[float]
+    _batch_lock: AbstractContextManager
+    _batch_window: float
+    _batch_size: int
+    _batch_stats: BatchStats
+    _last_event_id: str
+    "id of the last event read from the feed, sent as Last-Event-ID when the feed is reopened"
+    _seen_ids: set[str]
+    _seen_order: deque[str]
+    "the ids in _seen_ids, oldest first"
+    _journal: Journal
+    _queue_cap: int
+    "most nations a single queue holds"
+    _memory_budget: int
+    "estimated bytes the log and every queue may use together"
+    _ingestion_mode: str
     _update_thread: threading.Thread
+    _update_task: asyncio.Task
+    _compact_task: asyncio.Task
+    _expiry_task: asyncio.Task
+    _filter_stats_task: asyncio.Task
+    _snapshot_task: asyncio.Task
+    _flush_task: Optional[asyncio.Task]
     _running: bool
 
-    def __init__(self, pool: aiomysql.Pool):
-        self._whitelist = []
+    def __init__(
+        self,
+        pool: aiomysql.Pool,
+        ingestion_mode: str = "thread",
+        batch_window: float = 0.25,
+        batch_size: int = 500,
+        journal_path: str = JOURNAL_PATH,
+        queue_cap: int = QUEUE_CAP,
+        memory_budget: int = MEMORY_BUDGET,
+    ):
+        if ingestion_mode not in INGESTION_MODES:
+            raise ValueError(f"unknown ingestion mode: {ingestion_mode}")
+
+        self._whitelist = set()
         self._pool = pool
+        self._channels = {}
+        self._ingestion_mode = ingestion_mode
+        self._log = FoundingLog()
         self._queues = {}
-        self._queue_lock = threading.Lock()
-        self._filters = []
+        self._excluded_by = {}
+        self._registry_lock = self._new_lock()
+        self._log_lock = self._new_lock()
+        self._filters = FilterEngine()
         self._filter_lock = threading.Lock()
+        self._pending = []
+        self._pending_times = []
+        self._batch_lock = threading.Lock()
+        self._batch_window = batch_window
+        self._batch_size = batch_size
+        self._batch_stats = BatchStats()
+        self._last_event_id = ""
+        self._seen_ids = set()
+        self._seen_order = deque()
+        self._journal = Journal(journal_path)
+        self._queue_cap = queue_cap
+        self._memory_budget = memory_budget
+        self._flush_task = None
         self._running = True
 
+        if ingestion_mode == "async":
+            # the feed and the bot share one event loop, so queue mutations can never interleave
+            self._filter_lock = nullcontext()
+            self._batch_lock = nullcontext()
+
     def __repr__(self):
         return f"<QueueList queues={self._queues}>"
 
+    def _new_lock(self) -> AbstractContextManager:
+        "a lock for the registry, the log or a queue"
+        return nullcontext() if self._ingestion_mode == "async" else threading.Lock()
+
     async def _init_channels(self):
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute("SELECT channelId FROM recruitment_channels WHERE disabled = FALSE;")
-                channels: List[int] = [channel[0] for channel in await cur.fetchall()]
+                await cur.execute("SELECT id, channelId, messageId, serverId, disabled, maxAge FROM recruitment_channels;")
+
+                for id, channel_id, message_id, server_id, disabled, max_age in await cur.fetchall():
+                    self._channels[channel_id] = RecruitmentChannel(id, channel_id, message_id, server_id, bool(disabled), max_age)
 
-                for channel in channels:
-                    await cur.execute(
-                        """SELECT region
-                           FROM exceptions
-                                    JOIN recruitment_channels ON recruitment_channels.id = exceptions.channelId
-                           WHERE recruitment_channels.channelId = %s;""",
-                        (channel,),
-                    )
+                await cur.execute("SELECT channelId, region FROM exceptions;")
+                exceptions: dict[int, List[str]] = {}
 
-                    regions = [region[0] for region in await cur.fetchall()]
+                for id, region in await cur.fetchall():
+                    exceptions.setdefault(id, []).append(region)
 
-                    self.add_channel(channel, regions)
+                for channel in self.recruitment_channels():
+                    self.add_channel(channel.channel_id, exceptions.get(channel.id, []), channel.max_age or MAX_AGE)
 
                 await cur.execute("SELECT region FROM global_exceptions;")
                 regions: List[str] = [line[0] for line in await cur.fetchall()]
 
-                self._whitelist = regions
+                self._whitelist = set(regions)
 
     async def _init_filters(self):
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute("SELECT pattern FROM filters;")
+                await cur.execute("SELECT pattern, evaluations, hits, matchTime, maxMatchTime FROM filters;")
+                rows = await cur.fetchall()
+
+                stats = {row[0]: FilterStats(*row[1:]) for row in rows}
 
                 with self._filter_lock:
-                    self._filters = [re.compile(resp[0]) for resp in await cur.fetchall()]
+                    self._filters = FilterEngine((re.compile(row[0]) for row in rows), stats=stats)
 
     async def __aenter__(self):
         await self._init_channels()
         await self._init_filters()
         self._load_from_disk()
+        self._save_to_disk()
+
+        if self._ingestion_mode == "async":
+            self._update_task = asyncio.create_task(self._update_async())
+        else:
+            self._update_thread = threading.Thread(target=self._update, daemon=True)
+
+            self._update_thread.start()
 
-        self._update_thread = threading.Thread(target=self._update, daemon=True)
+        self._compact_task = asyncio.create_task(self._compact_loop())
+        self._expiry_task = asyncio.create_task(self._expiry_loop())
+        self._filter_stats_task = asyncio.create_task(self._filter_stats_loop())
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
 
-        self._update_thread.start()
+        if self._batch_window > 0:
+            self._flush_task = asyncio.create_task(self._flush_loop())
 
         return self
 
     async def __aexit__(self, exc_t, exc_v, exc_tb):
-        self._save_to_disk()
+        if self._ingestion_mode == "async":
+            self._update_task.cancel()
+
+        self._compact_task.cancel()
+        self._expiry_task.cancel()
+        self._filter_stats_task.cancel()
+        self._snapshot_task.cancel()
+
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+
+        await self._aflush()
+
+        if await self._asave_to_disk():
+            logger.info("Saved queue state to %s.", STATE_PATH)
+
+        self._journal.close()
+
+        try:
+            await self._save_filter_stats()
+        except Exception:
+            logger.exception("error while saving filter statistics")
+
         self._running = False
 
-    def _save_to_disk(self, path: str = "queue_state.json"):
-        with self._queue_lock:
-            state = {
-                str(channel_id): [
-                    {"name": n.name, "region": n.region, "founding_time": n.founding_time.isoformat()} for n in queue.snapshot()
-                ]
-                for channel_id, queue in self._queues.items()
-            }
+    def _capture_snapshot(self) -> dict:
+        "the queue state at this instant. the journal moves on to a new generation, which is replayed on top of it"
+        with self._batch_lock, ExitStack() as held:
+            with self._registry_lock:
+                queues = self._queues
 
+                for channel_id in sorted(queues):
+                    held.enter_context(queues[channel_id].lock)
+
+            with self._log_lock:
+                return self._state(self._journal.rotate(), queues)
+
+    def _state(self, generation: int, queues: Optional[dict[int, Queue]] = None) -> dict:
+        log = self._log
+        queues = self._queues if queues is None else queues
+
+        return {
+            "journal": generation,
+            "last_event_id": self._last_event_id,
+            "seen_event_ids": list(self._seen_order),
+            "start": log.start,
+            "log": [[log.name(seq), log.region(seq), log.founding_time(seq)] for seq in range(log.start, log.end)],
+            "queues": {str(channel_id): queue.state() for channel_id, queue in queues.items()},
+        }
+
+    def _write_snapshot(self, state: dict, path: str = STATE_PATH) -> bool:
         try:
-            with open(path, "w") as f:
-                json.dump(state, f)
-            logger.info("Saved queue state to %s.", path)
+            write_snapshot(f"{path}.tmp", state)
+            os.replace(f"{path}.tmp", path)
         except OSError as e:
             logger.error("Failed to save queue state: %s", e)
+            return False
+
+        # the snapshot covers every older generation
+        self._journal.discard_before(state["journal"])
+
+        return True
+
+    def _save_to_disk(self, path: str = STATE_PATH):
+        if self._write_snapshot(self._capture_snapshot(), path):
+            logger.info("Saved queue state to %s.", path)
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+            try:
+                await self._asave_to_disk()
+            except Exception:
+                logger.exception("error while saving queue snapshot")
+
+    async def _asave_to_disk(self) -> bool:
+        """capture and write a snapshot without blocking the event loop. in thread mode the capture takes the batch lock
+        and every queue lock, so it runs on a worker thread. in async mode nothing else runs on the loop meanwhile, so it
+        is captured there without locks"""
+        if self._ingestion_mode == "async":
+            state = self._capture_snapshot()
+        else:
+            state = await asyncio.to_thread(self._capture_snapshot)
+
+        return await asyncio.to_thread(self._write_snapshot, state)
+
+    def _load_from_disk(self, path: str = STATE_PATH, legacy_path: str = LEGACY_STATE_PATH):
+        "restore the last snapshot, then replay the journal written since it was taken"
+        generation = 0
+
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            try:
+                convert_state(legacy_path, path)
+                logger.info("Converted %s to a queue snapshot.", legacy_path)
+            except (OSError, ValueError) as e:
+                logger.error("Failed to convert %s: %s", legacy_path, e)
 
-    def _load_from_disk(self, path: str = "queue_state.json"):
         try:
-            with open(path, "r") as f:
-                state = json.load(f)
+            with Snapshot(path) as snapshot:
+                generation = self._restore_snapshot(snapshot)
         except FileNotFoundError:
             logger.info("No queue state file found; starting with empty queues.")
+        except (OSError, ValueError) as e:
+            # the journal only applies on top of the snapshot it follows, so it is not replayed either
+            logger.error("Failed to load queue state, starting with empty queues: %s", e)
+            self._reset()
             return
-        except (OSError, json.JSONDecodeError) as e:
-            logger.error("Failed to load queue state: %s", e)
-            return
 
-        current_time = datetime.now(timezone.utc)
-        max_age = timedelta(hours=1)
+        replayed = 0
+
+        for record in self._journal.replay(generation):
+            self._replay(record)
+            replayed += 1
+
+        if replayed:
+            logger.info("Replayed %d journal records.", replayed)
+
+        self.expire()
+        self._reapply_whitelists()
+
+        if self._last_event_id:
+            logger.info("Resuming the feed after event %s.", self._last_event_id)
+
+    def _reset(self):
+        "drop whatever a failed restore left behind"
+        self._last_event_id = ""
+        self._seen_ids = set()
+        self._seen_order = deque()
+        self._log.restore(0, [])
+
+        for queue in self._queues.values():
+            queue.purge()
+
+    def _restore_snapshot(self, snapshot: Snapshot) -> int:
+        """restore a snapshot written by _save_to_disk, returning the first journal generation that is not part of it.
+        only the queues of registered channels are read"""
+        self._last_event_id = snapshot.last_event_id
+
+        for event_id in snapshot.seen_event_ids:
+            self._remember(event_id)
+
+        self._log.restore(snapshot.start, (Nation(*nation) for nation in snapshot.nations()))
+
+        for channel_id, queue in self._queues.items():
+            if (saved := snapshot.queue_state(channel_id)) is None:
+                queue.purge()
+                continue
+
+            queue.load_state(saved)
+            logger.info("Restored %d nations to queue for channel %d.", queue.get_nation_count(), channel_id)
+
+        return snapshot.journal
+
+    def _replay(self, record: list):
+        kind, *args = record
+
+        if kind == "f":
+            name, region, timestamp = args
+            self._apply_founding(Nation(name, region, timestamp), set(), self._queues, self._excluded_by)
+        elif kind == "m":
+            self._apply_move(*args, self._queues, self._excluded_by)
+        elif kind == "h":
+            channel_id, seqs = args
+
+            if (queue := self._queues.get(channel_id)) is not None:
+                for seq in seqs:
+                    queue.skip(seq)
+        elif kind == "p":
+            self._log.expire(*args)
+        elif kind == "x":
+            channel_id, boundary = args
+
+            if (queue := self._queues.get(channel_id)) is not None:
+                queue.expire(boundary)
+        elif kind == "e":
+            self._last_event_id, event_ids = args
+
+            for event_id in event_ids:
+                self._remember(event_id)
+        else:
+            logger.warning("Skipping unknown journal record: %s", record)
+
+    def _reapply_whitelists(self):
+        "skip restored foundings in regions that were whitelisted while the state was on disk"
+        for seq in range(self._log.start, self._log.end):
+            region = self._log.region(seq)
+            channels = self._queues.keys() if region in self._whitelist else self._excluded_by.get(region, ())
+
+            for channel_id in channels:
+                self._queues[channel_id].skip(seq)
+
+    def _restore_legacy(self, state: dict):
+        "restore the per-channel nation lists written before the journal existed"
+        current_time = time.time()
+
+        restored: dict[int, List[Nation]] = {}
 
         for channel_id_str, entries in state.items():
             try:
@@ -256,21 +1045,30 @@ class QueueManager(AbstractAsyncContextManager):
             nations: List[Nation] = []
             for entry in entries:
                 try:
-                    founding_time = datetime.fromisoformat(entry["founding_time"])
+                    founding_time = int(datetime.fromisoformat(entry["founding_time"]).timestamp())
                     region = entry["region"]
                     name = entry["name"]
                 except (KeyError, TypeError, ValueError) as e:
                     logger.warning("Skipping malformed nation in queue state: %s.", e)
                     continue
 
-                if current_time - founding_time >= max_age:
+                if current_time - founding_time >= self._queues[channel_id].max_age:
                     continue
                 if region in self._whitelist:
                     continue
 
                 nations.append(Nation(name, region, founding_time))
 
-            self._queues[channel_id].restore(nations)
+            restored[channel_id] = nations
+
+        # every channel saves its own copy of a founding, so collapse them back into a single log entry
+        seqs: dict[tuple[str, int], int] = {}
+
+        for nation in merge_saved_queues(restored.values()):
+            seqs[(nation.name, nation.founding_time)] = self._log.append(nation)
+
+        for channel_id, nations in restored.items():
+            self._queues[channel_id].restore(seqs[key] for n in nations if (key := (n.name, n.founding_time)) in seqs)
             logger.info("Restored %d nations to queue for channel %d.", len(nations), channel_id)
 
     @property
@@ -285,7 +1083,7 @@ class QueueManager(AbstractAsyncContextManager):
                 async with conn.cursor() as cur:
                     await cur.execute("INSERT INTO global_exceptions (region) VALUES (%s);", (region,))
 
-            self._whitelist.append(region)
+            self._whitelist.add(region)
 
     async def remove_from_global_whitelist(self, region: str):
         region = region.lower().replace(" ", "_")
@@ -295,7 +1093,7 @@ class QueueManager(AbstractAsyncContextManager):
                 async with conn.cursor() as cur:
                     await cur.execute("DELETE FROM global_exceptions WHERE region = %s;", (region,))
 
-            self._whitelist.remove(region)
+            self._whitelist.discard(region)
 
     def _get_channel_queue(self, channel_id: int) -> Queue:
         try:
@@ -314,13 +1112,15 @@ class QueueManager(AbstractAsyncContextManager):
 
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(
-                    """INSERT INTO exceptions (channelId, region)
-                       VALUES ((SELECT id FROM recruitment_channels WHERE channelId = %s), %s);""",
-                    (channel_id, region),
-                )
+                await cur.execute("INSERT INTO exceptions (channelId, region) VALUES (%s, %s);", (self._channels[channel_id].id, region))
 
-        self._get_channel_queue(channel_id).whitelist.append(region)
+        queue = self._get_channel_queue(channel_id)
+
+        with queue.lock:
+            queue.add_to_whitelist(region)
+
+        with self._registry_lock:
+            self._index_region(channel_id, region)
 
     async def remove_from_channel_whitelist(self, channel_id: int, region: str):
         region = region.strip().lower().replace(" ", "_")
@@ -330,20 +1130,40 @@ class QueueManager(AbstractAsyncContextManager):
 
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(
-                    """DELETE
-                       FROM exceptions
-                       WHERE region = %s
-                         AND channelId = (SELECT id
-                                          FROM recruitment_channels
-                                          WHERE channelId = %s);""",
-                    (region, channel_id),
-                )
+                await cur.execute("DELETE FROM exceptions WHERE region = %s AND channelId = %s;", (region, self._channels[channel_id].id))
+
+        queue = self._get_channel_queue(channel_id)
+
+        with queue.lock:
+            queue.remove_from_whitelist(region)
 
-        self._get_channel_queue(channel_id).whitelist.remove(region)
+        with self._registry_lock:
+            self._unindex_region(channel_id, region)
 
     def list_whitelist(self, channel_id: int):
-        return (self._whitelist, self._get_channel_queue(channel_id).whitelist)
+        return (sorted(self._whitelist), sorted(self._get_channel_queue(channel_id).whitelist))
+
+    def _index_region(self, channel_id: int, region: str):
+        "called with the registry lock held"
+        excluded_by = dict(self._excluded_by)
+        excluded_by[region] = excluded_by.get(region, frozenset()) | {channel_id}
+        self._excluded_by = excluded_by
+
+    def _unindex_region(self, channel_id: int, region: str):
+        "called with the registry lock held"
+        channels = self._excluded_by.get(region)
+
+        if channels is None or channel_id not in channels:
+            return
+
+        excluded_by = dict(self._excluded_by)
+
+        if channels := channels - {channel_id}:
+            excluded_by[region] = channels
+        else:
+            del excluded_by[region]
+
+        self._excluded_by = excluded_by
 
     async def add_global_filter(self, pattern: str):
         try:
@@ -357,7 +1177,7 @@ class QueueManager(AbstractAsyncContextManager):
                 return
 
             with self._filter_lock:
-                self._filters.append(new_filter)
+                self._filters.add(new_filter)
 
             await self._db_insert_filter(pattern)
 
@@ -389,31 +1209,258 @@ class QueueManager(AbstractAsyncContextManager):
 
     def _is_filtered(self, nation: str) -> bool:
         with self._filter_lock:
-            return any(nation_filter.match(nation) for nation_filter in self._filters)
+            return self._filters.match(nation)
 
     def matching_filters(self, nation: str) -> List[str]:
         with self._filter_lock:
-            return [f.pattern for f in self._filters if f.match(nation)]
+            return self._filters.matching(nation)
+
+    def filter_stats(self) -> dict[str, FilterStats]:
+        with self._filter_lock:
+            return self._filters.stats()
+
+    async def _save_filter_stats(self):
+        stats = self.filter_stats()
+
+        if not stats:
+            return
+
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(
+                    "UPDATE filters SET evaluations = %s, hits = %s, matchTime = %s, maxMatchTime = %s WHERE pattern = %s;",
+                    [(s.evaluations, s.hits, s.match_time, s.max_match_time, pattern) for pattern, s in stats.items()],
+                )
+
+    async def _filter_stats_loop(self):
+        while True:
+            await asyncio.sleep(FILTER_STATS_INTERVAL)
+
+            try:
+                await self._save_filter_stats()
+            except Exception:
+                logger.exception("error while saving filter statistics")
 
     def channel(self, channel_id: int) -> Queue:
-        with self._queue_lock:
-            return self._queues[channel_id]
+        return self._queues[channel_id]
+
+    def recruitment_channel(self, channel_id: int) -> Optional[RecruitmentChannel]:
+        "the registration of a channel, whether or not it is disabled"
+        return self._channels.get(channel_id)
+
+    def recruitment_channels(self) -> List[RecruitmentChannel]:
+        "every channel that is registered and not disabled"
+        return [channel for channel in self._channels.values() if not channel.disabled]
+
+    def put_recruitment_channel(self, channel: RecruitmentChannel):
+        "record a channel that was registered, or whose registration changed in the database"
+        self._channels[channel.channel_id] = channel
+
+    def add_channel(self, channel_id: int, regions: List[str], max_age: int = MAX_AGE):
+        with self._registry_lock:
+            if (previous := self._queues.get(channel_id)) is not None:
+                for region in previous.whitelist:
+                    self._unindex_region(channel_id, region)
 
-    def add_channel(self, channel_id: int, regions: List[str]):
-        with self._queue_lock:
-            self._queues[channel_id] = Queue(whitelist=regions)
+            queue = Queue(self._log, whitelist=regions, max_age=max_age, lock=self._new_lock())
+            self._queues = {**self._queues, channel_id: queue}
+
+            for region in queue.whitelist:
+                self._index_region(channel_id, region)
 
     def remove_channel(self, channel_id: int) -> bool:
-        with self._queue_lock:
-            return self._queues.pop(channel_id, None) is not None
+        with self._registry_lock:
+            if (queue := self._queues.get(channel_id)) is None:
+                return False
+
+            self._queues = {c: q for c, q in self._queues.items() if c != channel_id}
+
+            for region in queue.whitelist:
+                self._unindex_region(channel_id, region)
+
+            return True
+
+    def hand_out(self, user: discord.User, channel_id: int, return_count: int = 8) -> Handout:
+        """take nations for a recruiter whose claim on them is still to be recorded. they are only journaled as handed out
+        by commit, and go back to the queue with give_back if the claim fails"""
+        queue = self._queues[channel_id]
+
+        with queue.lock:
+            seqs = queue.hold(user, return_count)
+
+            # the seqs cannot expire from the log while the queue is held, but expire may be moving the columns
+            with self._log_lock:
+                return Handout(channel_id, seqs, [self._log.name(seq) for seq in seqs])
+
+    def commit(self, handout: Handout):
+        if (queue := self._queues.get(handout.channel_id)) is None:
+            return
 
-    def get_nations(self, user: discord.User, channel_id: int, return_count: int = 8) -> List[str]:
-        with self._queue_lock:
-            return self._queues[channel_id].get_nations(user, return_count)
+        with queue.lock:
+            queue.claim(handout.seqs)
+            self._journal.append([["h", handout.channel_id, handout.seqs]])
+
+    def give_back(self, handout: Handout):
+        if (queue := self._queues.get(handout.channel_id)) is None:
+            return
+
+        with queue.lock:
+            queue.give_back(handout.seqs)
 
     def get_nation_count(self, channel_id: int) -> int:
-        with self._queue_lock:
-            return self._queues[channel_id].get_nation_count()
+        queue = self._queues[channel_id]
+
+        with queue.lock:
+            return queue.get_nation_count()
+
+    def compact(self):
+        for queue in self._queues.values():
+            self._compact_queue(queue)
+
+    @staticmethod
+    def _compact_queue(queue: Queue):
+        with queue.lock:
+            queue.compact()
+
+    async def _acompact(self):
+        """compact one queue at a time without blocking the event loop. in thread mode each queue is compacted on a worker
+        thread, since the feed may be holding its lock, and in async mode the loop gets a turn between queues"""
+        for queue in self._queues.values():
+            if self._ingestion_mode == "async":
+                queue.compact()
+                await asyncio.sleep(0)
+            else:
+                await asyncio.to_thread(self._compact_queue, queue)
+
+    def expire(self):
+        """drop every time bucket of foundings that has outlived the max age of each queue, evict the oldest nations of
+        queues over the cap and, while over the memory budget, of idle queues, then release from the log every founding
+        that no queue holds any more. each queue is locked in turn, so handouts elsewhere carry on meanwhile"""
+        now = int(time.time())
+        queues = self._queues
+        start = self._log.start
+        boundaries: dict[int, int] = {}
+        evicted: List[list] = []
+
+        for channel_id, queue in queues.items():
+            if (boundary := boundaries.get(queue.max_age)) is None:
+                with self._log_lock:
+                    boundary = boundaries[queue.max_age] = self._log.boundary(queue.max_age, now)
+
+            with queue.lock:
+                queue.expire(boundary)
+
+                if (excess := queue.get_nation_count() - self._queue_cap) > 0:
+                    queue.evict(excess)
+                    evicted.append(["x", channel_id, queue.first])
+
+        self._release(queues, now)
+        evicted.extend(self._evict_over_budget(queues, idle=True))
+        evicted.extend(self._evict_over_budget(queues, idle=False))
+
+        if self._log.start != start:
+            evicted.append(["p", self._log.start])
+
+        self._journal.append(evicted)
+
+    def _release(self, queues: dict[int, Queue], now: int):
+        "release from the log every founding that no queue holds any more"
+        # a queue's first sequence number only moves forward, so it can be read without holding the queue
+        with self._log_lock:
+            self._log.expire(min((queue.first for queue in queues.values()), default=self._log.boundary(MAX_AGE, now)))
+
+    def _evict_over_budget(self, queues: dict[int, Queue], idle: bool) -> List[list]:
+        """evict the oldest foundings until the estimate fits the memory budget. idle queues are evicted from first, but only
+        as far as the active queues let the log shrink. when that cannot free enough, the oldest nations of active queues
+        are evicted too"""
+        excess = self.estimated_bytes() - self._memory_budget
+
+        if excess <= 0:
+            return []
+
+        if not idle:
+            logger.warning("Queues are %d bytes over the memory budget, evicting the oldest nations of active channels.", excess)
+
+        # the log only shrinks from its oldest founding, which is released once every queue has let go of it
+        target = min(self._log.end, self._log.start + math.ceil(excess / self._log.bytes_per_nation))
+        now = time.monotonic()
+        evicted = []
+
+        if idle:
+            # evicting idle queues frees nothing past the oldest founding an active queue still holds
+            target = min([target, *(queue.first for queue in queues.values() if queue.idle_for(now) < IDLE_AFTER)])
+
+            if target <= self._log.start:
+                return []
+
+        for channel_id, queue in queues.items():
+            with queue.lock:
+                if queue.first < target and (queue.idle_for(now) >= IDLE_AFTER or not idle):
+                    queue.expire(target)
+                    evicted.append(["x", channel_id, queue.first])
+
+        self._release(queues, int(time.time()))
+
+        return evicted
+
+    def estimated_bytes(self) -> int:
+        "estimated memory held by the founding log and every queue. an estimate, so it is read without locking"
+        return self._log.estimated_bytes + sum(queue.estimated_bytes() for queue in self._queues.values())
+
+    def queue_usage(self) -> List[QueueUsage]:
+        now = time.monotonic()
+        per_nation = self._log.bytes_per_nation
+        usage = []
+
+        for channel_id, queue in self._queues.items():
+            with queue.lock:
+                count = queue.get_nation_count()
+                usage.append(QueueUsage(channel_id, count, int(count * per_nation) + queue.estimated_bytes(), queue.idle_for(now)))
+
+        return usage
+
+    @property
+    def memory_budget(self) -> int:
+        return self._memory_budget
+
+    @property
+    def queue_cap(self) -> int:
+        return self._queue_cap
+
+    async def _expiry_loop(self):
+        while True:
+            await asyncio.sleep(BUCKET_SECONDS)
+
+            try:
+                self.expire()
+            except Exception:
+                logger.exception("error while expiring queues")
+
+    async def set_max_age(self, channel_id: int, max_age: int):
+        self._get_channel_queue(channel_id)
+        channel = self._channels[channel_id]
+
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("UPDATE recruitment_channels SET maxAge = %s WHERE id = %s;", (max_age, channel.id))
+
+        channel.max_age = max_age
+
+        queue = self._get_channel_queue(channel_id)
+
+        with queue.lock:
+            queue.max_age = max_age
+
+        self.expire()
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(COMPACT_INTERVAL)
+
+            try:
+                await self._acompact()
+            except Exception:
+                logger.exception("error while compacting queues")
 
     def _handle_founding(self, event: FoundingEvent):
         if self._is_filtered(event.nation):
@@ -424,9 +1471,7 @@ class QueueManager(AbstractAsyncContextManager):
             logger.debug("founding in whitelisted region; skipping %s", event.nation)
             return
 
-        with self._queue_lock:
-            for _, queue in self._queues.items():
-                queue.handle_founding(Nation(event.nation, event.region, event.timestamp.astimezone(timezone.utc)))
+        self._enqueue(event)
 
     def _handle_move(self, event: MoveEvent):
         if self._is_filtered(event.nation):
@@ -437,35 +1482,252 @@ class QueueManager(AbstractAsyncContextManager):
             logger.debug("move to whitelisted region; skipping %s", event.nation)
             return
 
-        with self._queue_lock:
-            for _, queue in self._queues.items():
-                queue.handle_move(event.nation, event.moved_to)
+        self._enqueue(event)
+
+    def _remember(self, event_id: str) -> bool:
+        "record an event id as seen. returns False if it already was"
+        if event_id in self._seen_ids:
+            return False
+
+        self._seen_ids.add(event_id)
+        self._seen_order.append(event_id)
+
+        if len(self._seen_order) > SEEN_EVENT_IDS:
+            self._seen_ids.discard(self._seen_order.popleft())
+
+        return True
+
+    def _enqueue(self, event: FoundingEvent | MoveEvent):
+        with self._batch_lock:
+            if event.id and not self._remember(event.id):
+                logger.debug("event %s was already seen; skipping %s", event.id, event.nation)
+                return
+
+            self._pending.append(event)
+            self._pending_times.append(time.monotonic())
+
+            if self._batch_window <= 0 or len(self._pending) >= self._batch_size:
+                self._flush_pending()
+
+    def flush(self):
+        "apply every buffered event now"
+        with self._batch_lock:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if not self._pending:
+            return
+
+        events, times = self._pending, self._pending_times
+        self._pending, self._pending_times = [], []
+
+        # a move of a nation founded earlier in the same batch is folded into that founding, so the founding is
+        # cancelled for the channels that whitelist the destination before it is ever queued
+        foundings: dict[str, tuple[Nation, set[str]]] = {}
+        batch: List[tuple[Nation, set[str]] | MoveEvent] = []
+
+        for event in events:
+            if isinstance(event, FoundingEvent):
+                founding = (Nation(event.nation, event.region, event.timestamp), set())
+                foundings[event.nation] = founding
+                batch.append(founding)
+            elif (founding := foundings.get(event.nation)) is not None:
+                founding[1].add(event.moved_to)
+            else:
+                batch.append(event)
+
+        records = []
+
+        for item in batch:
+            if isinstance(item, MoveEvent):
+                records.append(["m", item.nation, item.moved_to])
+            else:
+                nation, moved_to = item
+                records.append(["f", nation.name, nation.region, nation.founding_time])
+                records.extend(["m", nation.name, region] for region in moved_to)
+
+        records.append(["e", self._last_event_id, [event.id for event in events if event.id]])
+
+        # the records go out before any founding becomes visible, so a handout of it is always journaled after it
+        self._journal.append(records)
+
+        # only the channels that whitelist a region in this batch are held, and only while it is applied. every other
+        # channel keeps handing out nations, and picks the new foundings up as soon as they are in the log
+        queues, excluded_by = self._queues, self._excluded_by
+        regions = {item.moved_to if isinstance(item, MoveEvent) else item[0].region for item in batch}
+        regions.update(region for item in batch if not isinstance(item, MoveEvent) for region in item[1])
+        affected = sorted({channel_id for region in regions for channel_id in excluded_by.get(region, ())})
+
+        with ExitStack() as held:
+            for channel_id in affected:
+                held.enter_context(queues[channel_id].lock)
+
+            for item in batch:
+                if isinstance(item, MoveEvent):
+                    self._apply_move(item.nation, item.moved_to, queues, excluded_by)
+                else:
+                    self._apply_founding(*item, queues, excluded_by)
+
+        now = time.monotonic()
+        latencies = [now - received for received in times]
+
+        stats = self._batch_stats
+        stats.batches += 1
+        stats.events += len(events)
+        stats.max_size = max(stats.max_size, len(events))
+        stats.latency += sum(latencies)
+        stats.max_latency = max(stats.max_latency, max(latencies))
+
+    def _apply_founding(self, nation: Nation, moved_to: set[str], queues: dict[int, Queue], excluded_by: dict[str, frozenset[int]]):
+        "append a founding to the log. the queues that whitelist its region, or where it moved, must already be held"
+        with self._log_lock:
+            seq = self._log.append(nation)
+
+        for channel_id in excluded_by.get(nation.region, ()):
+            queues[channel_id].handle_founding(seq, nation)
+
+        for region in moved_to:
+            self._apply_move(nation.name, region, queues, excluded_by)
+
+    def _apply_move(self, nation_name: str, destination: str, queues: dict[int, Queue], excluded_by: dict[str, frozenset[int]]):
+        for channel_id in excluded_by.get(destination, ()):
+            queues[channel_id].handle_move(nation_name, destination)
+
+    def batch_stats(self) -> BatchStats:
+        with self._batch_lock:
+            return replace(self._batch_stats)
+
+    async def _aflush(self):
+        "flush without blocking the event loop. in thread mode the ingestion thread holds the batch lock while it applies a batch"
+        if self._ingestion_mode == "async":
+            self.flush()
+        else:
+            await asyncio.to_thread(self.flush)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self._batch_window)
+
+            try:
+                await self._aflush()
+            except Exception:
+                logger.exception("error while applying event batch")
 
     def _handle_event(self, ev: ServerSentEvent):
-        event: Event = json.loads(ev.data, object_hook=Event.from_json)
+        event = parse(ev.data)
+
+        if event is not None and not event.id:
+            event.id = ev.id
+
+        if isinstance(event, FoundingEvent):
+            self._handle_founding(event)
+        elif isinstance(event, MoveEvent):
+            self._handle_move(event)
 
-        if match := FOUNDING_REGEX.match(event.str):
-            self._handle_founding(FoundingEvent(match[1], match[2], datetime.fromtimestamp(event.timestamp)))
-        elif match := MOVE_REGEX.match(event.str):
-            self._handle_move(MoveEvent(match[1], match[2], match[3], datetime.fromtimestamp(event.timestamp)))
+        if ev.id:
+            self._last_event_id = ev.id
 
         if not self._running:
             raise asyncio.CancelledError()
 
+    def _consume(self, events: Iterable[ServerSentEvent]):
+        for event in events:
+            self._handle_event(event)
+
+    async def _aconsume(self, events: AsyncIterable[ServerSentEvent]):
+        async for event in events:
+            self._handle_event(event)
+
     def _update(self):
         logger.info("starting update thread")
 
         with httpx.Client(headers=HEADERS, timeout=None) as client:
             while True:
                 try:
-                    for event in sse_retrying(client, "GET", "https://www.nationstates.net/api/founding+move"):
-                        self._handle_event(event)
+                    self._consume(sse_retrying(client, "GET", FEED_URL, self._last_event_id))
+                except Exception:
+                    logger.exception("error in SSE feed")
+
+    async def _update_async(self):
+        logger.info("starting update task")
+
+        async with httpx.AsyncClient(headers=HEADERS, timeout=None) as client:
+            while True:
+                try:
+                    await self._aconsume(asse_retrying(client, "GET", FEED_URL, self._last_event_id))
                 except Exception:
                     logger.exception("error in SSE feed")
 
 
-def sse_retrying(client, method, url):
-    last_event_id = ""
+def convert_state(source: str = LEGACY_STATE_PATH, destination: str = STATE_PATH):
+    """convert the per-channel JSON queue state of earlier versions into a binary snapshot.
+
+    the queues are restored into a throwaway QueueManager without whitelists, since whitelists are applied again when the
+    snapshot is loaded"""
+    with open(source, "r") as f:
+        state = json.load(f)
+
+    manager = QueueManager(None)
+
+    for channel_id in state:
+        if channel_id.isdigit():
+            manager.add_channel(int(channel_id), [])
+
+    manager._restore_legacy(state)
+    write_snapshot(destination, manager._state(0))
+
+
+def merge_saved_queues(queues: Iterable[List[Nation]]) -> List[Nation]:
+    """merge saved queues, each newest first, into one oldest first list of unique foundings.
+
+    foundings in the same second can only be ordered by the queues that hold them, so this is a topological sort of the
+    queue orders that takes the oldest founding whenever there is a choice. queues that disagree on an order leave a
+    cycle, whose foundings follow the rest by founding time"""
+    nations: dict[tuple[str, int], Nation] = {}
+    successors: dict[tuple[str, int], set[tuple[str, int]]] = {}
+    blockers: dict[tuple[str, int], int] = {}
+
+    for queue in queues:
+        previous = None
+
+        for nation in reversed(queue):
+            key = (nation.name, nation.founding_time)
+
+            if key == previous:
+                continue
+
+            nations[key] = nation
+            successors.setdefault(key, set())
+            blockers.setdefault(key, 0)
+
+            if previous is not None and key not in successors[previous]:
+                successors[previous].add(key)
+                blockers[key] += 1
+
+            previous = key
+
+    ready = [(key[1], key) for key, count in blockers.items() if count == 0]
+    heapq.heapify(ready)
+    merged = []
+
+    while ready:
+        _, key = heapq.heappop(ready)
+        merged.append(nations[key])
+
+        for successor in successors[key]:
+            blockers[successor] -= 1
+
+            if blockers[successor] == 0:
+                heapq.heappush(ready, (successor[1], successor))
+
+    if len(merged) < len(nations):
+        emitted = {(nation.name, nation.founding_time) for nation in merged}
+        merged.extend(nations[key] for _, key in sorted((key[1], key) for key in nations if key not in emitted))
+
+    return merged
+
+
+def sse_retrying(client, method, url, last_event_id=""):
     reconnection_delay = 0.0
 
     @retry(on=httpx.ReadError)
@@ -487,3 +1749,23 @@ def sse_retrying(client, method, url):
                 yield sse
 
     return _iter_sse()
+
+
+async def asse_retrying(client: httpx.AsyncClient, method: str, url: str, last_event_id: str = "") -> AsyncIterator[ServerSentEvent]:
+    reconnection_delay = 0.0
+
+    async for attempt in retry_context(on=httpx.ReadError):
+        with attempt:
+            await asyncio.sleep(reconnection_delay)
+
+            if last_event_id:
+                HEADERS["Last-Event-ID"] = last_event_id
+
+            async with aconnect_sse(client, method, url, headers=HEADERS) as event_source:
+                async for sse in event_source.aiter_sse():
+                    last_event_id = sse.id
+
+                    if sse.retry is not None:
+                        reconnection_delay = sse.retry / 1000
+
+                    yield sse
@@ -0,0 +1,270 @@
+"""Binary queue snapshots.
+
+A snapshot holds the shared founding log once, with every string interned into a single table, founding times as integer
+epochs, and each channel's queue as arrays of log sequence numbers. Every section is a flat little-endian array at an
+8-byte aligned offset, so a snapshot is read through mmap and only the parts that are asked for are ever decoded.
+
+    header
+    string offsets   u32[strings + 1]
+    string data      utf-8
+    nation names     u32[nations]     indices into the string table
+    nation regions   u32[nations]
+    founding times   i64[nations]     unix epochs
+    seen event ids   u32[seen]
+    channels         (id, cursor, offset, ranges, skipped)[channels]
+    channel data     u32[2 * ranges]  start and end pairs, then u32[skipped], at each channel's offset
+
+sequence numbers in the channel data are stored relative to the log start, so they index the nation arrays directly.
+
+Converting a queue_state.json into a snapshot:
+
+    uv run -m components.snapshot [queue_state.json] [queue_state.bin]
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterator, Optional
+
+MAGIC = b"RQSN"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIqIIIIi")
+"magic, version, flags, journal generation, log start, nations, strings, channels, seen event ids, last event id string"
+CHANNEL = struct.Struct("<qqQII")
+"channel id, cursor, offset of the channel data, number of ranges, number of skipped sequence numbers"
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _pack(typecode: str, values) -> bytes:
+    data = array(typecode, values)
+
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    return data.tobytes()
+
+
+def write(path: str, state: dict):
+    """write a queue state, as captured by QueueManager, to path"""
+    strings: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    names = [intern(name) for name, _, _ in state["log"]]
+    regions = [intern(region) for _, region, _ in state["log"]]
+    times = [timestamp for _, _, timestamp in state["log"]]
+    seen = [intern(event_id) for event_id in state["seen_event_ids"]]
+    last_event_id = intern(state["last_event_id"]) if state["last_event_id"] else -1
+
+    encoded = [value.encode() for value in strings]
+    offsets = [0]
+
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+
+    sections = [_pack("I", offsets), b"".join(encoded), _pack("I", names), _pack("I", regions), _pack("q", times), _pack("I", seen)]
+
+    queues = [(int(channel_id), queue) for channel_id, queue in state["queues"].items()]
+    position = _align(HEADER.size)
+
+    for section in sections:
+        position = _align(position + len(section))
+
+    position = _align(position + CHANNEL.size * len(queues))
+    directory = []
+    channel_data = []
+
+    for channel_id, queue in queues:
+        start = state["start"]
+        data = _pack("I", [seq - start for r in queue["ranges"] for seq in r]) + _pack("I", [seq - start for seq in queue["skipped"]])
+        directory.append(CHANNEL.pack(channel_id, queue["cursor"], position, len(queue["ranges"]), len(queue["skipped"])))
+        channel_data.append(data)
+        position += len(data)
+
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, state["journal"], state["start"], len(names), len(strings), len(queues), len(seen), last_event_id
+    )
+
+    with open(path, "wb") as f:
+        f.write(header)
+
+        for section in [*sections, b"".join(directory)]:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(section)
+
+        f.write(b"\0" * (_align(f.tell()) - f.tell()))
+
+        for data in channel_data:
+            f.write(data)
+
+
+class Snapshot:
+    """a snapshot opened through mmap. strings, nations and channel queues are decoded on access"""
+
+    _mmap: mmap.mmap
+    _strings: list[Optional[str]]
+    "decoded strings, filled in as they are first used"
+    _string_offsets: Optional[array]
+    _offsets: int
+    _data: int
+    _data_size: int
+    "bytes of utf-8 string data"
+    _names: int
+    _regions: int
+    _times: int
+    _seen: int
+    _seen_count: int
+    _last: int
+    "string index of the last event id, or -1"
+    _channels: dict[int, tuple[int, int, int, int]]
+    "channel id to its cursor, data offset, number of ranges and number of skipped sequence numbers"
+
+    journal: int
+    "first journal generation that is not part of this snapshot"
+    start: int
+    "sequence number of the first nation in the log"
+    nation_count: int
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise SnapshotError("truncated snapshot header")
+
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._read_directory()
+        except SnapshotError:
+            self.close()
+            raise
+
+    def _read_directory(self):
+        "read the header and locate every section, checking that each lies within the file"
+        magic, version, _, self.journal, self.start, self.nation_count, string_count, channel_count, self._seen_count, self._last = (
+            HEADER.unpack_from(self._mmap)
+        )
+
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"not a version {VERSION} queue snapshot")
+
+        if self._last >= string_count:
+            raise SnapshotError("last event id is not in the string table")
+
+        self._strings = [None] * string_count
+        self._string_offsets = None
+        self._offsets = _align(HEADER.size)
+        self._require(self._offsets + 4 * (string_count + 1), "string offsets")
+        self._data = _align(self._offsets + 4 * (string_count + 1))
+        self._data_size = self._array("I", self._offsets + 4 * string_count, 1)[0]
+        self._names = _align(self._data + self._data_size)
+        self._regions = _align(self._names + 4 * self.nation_count)
+        self._times = _align(self._regions + 4 * self.nation_count)
+        self._seen = _align(self._times + 8 * self.nation_count)
+        directory = _align(self._seen + 4 * self._seen_count)
+        self._require(directory + CHANNEL.size * channel_count, "channel directory")
+
+        self._channels = {}
+
+        for index in range(channel_count):
+            channel_id, cursor, offset, range_count, skipped_count = CHANNEL.unpack_from(self._mmap, directory + index * CHANNEL.size)
+            self._require(offset + 8 * range_count + 4 * skipped_count, f"data of channel {channel_id}")
+            self._channels[channel_id] = (cursor, offset, range_count, skipped_count)
+
+    def _require(self, end: int, section: str):
+        if end > len(self._mmap):
+            raise SnapshotError(f"snapshot truncated at byte {len(self._mmap)}, before the end of the {section} at {end}")
+
+    def __repr__(self):
+        return f"<Snapshot nations={self.nation_count} channels={len(self._channels)}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_t, exc_v, exc_tb):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+
+    def _array(self, typecode: str, offset: int, count: int) -> array:
+        data = array(typecode)
+        data.frombytes(self._mmap[offset : offset + data.itemsize * count])
+
+        if sys.byteorder != "little":
+            data.byteswap()
+
+        return data
+
+    def string(self, index: int) -> str:
+        if index >= len(self._strings):
+            raise SnapshotError(f"string {index} is not in the string table")
+
+        if (value := self._strings[index]) is None:
+            if self._string_offsets is None:
+                self._string_offsets = self._array("I", self._offsets, len(self._strings) + 1)
+
+            lo, hi = self._string_offsets[index], self._string_offsets[index + 1]
+
+            if not lo <= hi <= self._data_size:
+                raise SnapshotError(f"string {index} lies outside the string data")
+
+            value = self._strings[index] = self._mmap[self._data + lo : self._data + hi].decode()
+
+        return value
+
+    @property
+    def last_event_id(self) -> str:
+        return self.string(self._last) if self._last >= 0 else ""
+
+    @property
+    def seen_event_ids(self) -> list[str]:
+        return [self.string(index) for index in self._array("I", self._seen, self._seen_count)]
+
+    def nations(self) -> Iterator[tuple[str, str, int]]:
+        "name, region and founding epoch of every nation in the log, oldest first"
+        names = self._array("I", self._names, self.nation_count)
+        regions = self._array("I", self._regions, self.nation_count)
+        times = self._array("q", self._times, self.nation_count)
+
+        for name, region, timestamp in zip(names, regions, times):
+            yield self.string(name), self.string(region), timestamp
+
+    def queue_state(self, channel_id: int) -> Optional[dict]:
+        "the saved state of a channel's queue, in the form Queue.load_state takes"
+        if (entry := self._channels.get(channel_id)) is None:
+            return None
+
+        cursor, offset, range_count, skipped_count = entry
+        start = self.start
+        bounds = self._array("I", offset, 2 * range_count)
+
+        return {
+            "ranges": [[start + bounds[i], start + bounds[i + 1]] for i in range(0, len(bounds), 2)],
+            "cursor": cursor,
+            "skipped": [start + seq for seq in self._array("I", offset + 8 * range_count, skipped_count)],
+        }
+
+
+def main():
+    from components.queue import convert_state
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "queue_state.json"
+    destination = sys.argv[2] if len(sys.argv) > 2 else "queue_state.bin"
+
+    convert_state(source, destination)
+    print(f"converted {source} to {destination}")
+
+
+if __name__ == "__main__":
+    main()
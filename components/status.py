@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import discord
+
+from components.queue import QueueManager
+
+logger = logging.getLogger("main")
+
+EMBED_CONCURRENCY = 5
+"""status embeds edited at once. discord.py still holds each edit behind its channel's rate-limit bucket and the global
+limit, this only bounds how many are waiting on them"""
+EMBED_DELAY = 2.0
+"seconds between a click marking a channel's embed dirty and the edit going out"
+
+
+@dataclass
+class RefreshStats:
+    channels: int = 0
+    edited: int = 0
+    skipped: int = 0
+    "embeds left alone because their queue had not changed"
+    failed: int = 0
+    duration: float = 0.0
+    "seconds the pass took"
+
+
+class StatusEmbeds:
+    """keeps the status embed of every recruitment channel in step with its queue.
+
+    a pass compares each queue's version against the one its embed last showed and edits only the embeds that changed,
+    several at once. edits go through PartialMessage handles, so no message is fetched before it is edited"""
+
+    _client: discord.Client
+    _queues: QueueManager
+    _shown: dict[int, tuple]
+    "queue version each channel's embed last showed"
+    _messages: dict[int, discord.PartialMessage]
+    "handle to each channel's status message"
+    _semaphore: asyncio.Semaphore
+    _last_pass: RefreshStats
+    _delay: float
+    _scheduled: dict[int, asyncio.Task]
+    "edit waiting out the delay for each channel marked dirty"
+
+    def __init__(self, client: discord.Client, queues: QueueManager, concurrency: int = EMBED_CONCURRENCY, delay: float = EMBED_DELAY):
+        self._client = client
+        self._queues = queues
+        self._shown = {}
+        self._messages = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._last_pass = RefreshStats()
+        self._delay = delay
+        self._scheduled = {}
+
+    def __repr__(self):
+        return f"<StatusEmbeds shown={len(self._shown)}>"
+
+    @property
+    def last_pass(self) -> RefreshStats:
+        "the last pass over every channel"
+        return self._last_pass
+
+    def schedule(self, channel_id: int):
+        "mark a channel's embed dirty. one edit goes out after the delay, however many times it is marked in the meantime"
+        if channel_id not in self._scheduled:
+            self._scheduled[channel_id] = asyncio.create_task(self._update_later(channel_id))
+
+    def stop(self):
+        "cancel the edits that are still waiting out their delay"
+        for task in self._scheduled.values():
+            task.cancel()
+
+        self._scheduled = {}
+
+    def forget(self, channel_id: int):
+        "drop what is known about a channel's embed, so that the next pass edits it"
+        self._shown.pop(channel_id, None)
+        self._messages.pop(channel_id, None)
+
+    async def refresh(self, channel_ids: Optional[Iterable[int]] = None) -> RefreshStats:
+        "edit the embeds of the given channels, or of every enabled channel, whose queue changed since they were last edited"
+        full = channel_ids is None
+
+        if full:
+            channel_ids = [channel.channel_id for channel in self._queues.recruitment_channels()]
+
+        start = time.perf_counter()
+        stats = RefreshStats()
+        changed = []
+
+        for channel_id in channel_ids:
+            stats.channels += 1
+
+            try:
+                version = self._queues.channel(channel_id).version
+            except KeyError:
+                logger.warning("channel %d has no queue, skipping", channel_id)
+                stats.failed += 1
+                continue
+
+            if self._shown.get(channel_id) == version:
+                stats.skipped += 1
+            else:
+                changed.append((channel_id, version))
+
+        results = await asyncio.gather(*(self._edit(channel_id, version) for channel_id, version in changed), return_exceptions=True)
+
+        for (channel_id, _version), result in zip(changed, results):
+            if isinstance(result, BaseException):
+                logger.error("error while editing the status embed of channel %d", channel_id, exc_info=result)
+                stats.failed += 1
+            elif result:
+                stats.edited += 1
+            else:
+                stats.failed += 1
+
+        stats.duration = time.perf_counter() - start
+
+        if full:
+            self._last_pass = stats
+
+        return stats
+
+    async def update(self, channel_id: int) -> bool:
+        "edit one channel's embed if its queue changed, returning whether it was edited"
+        stats = await self.refresh([channel_id])
+
+        return stats.edited == 1
+
+    async def _update_later(self, channel_id: int):
+        await asyncio.sleep(self._delay)
+
+        # dropped before the edit, so that a click while it is in flight schedules another with the newer count
+        del self._scheduled[channel_id]
+
+        try:
+            await self.update(channel_id)
+        except Exception:
+            logger.exception("error while updating the status embed of channel %d", channel_id)
+
+    def _message(self, channel_id: int) -> Optional[discord.PartialMessage]:
+        registration = self._queues.recruitment_channel(channel_id)
+
+        if registration is None or registration.disabled:
+            return None
+
+        message = self._messages.get(channel_id)
+
+        if message is None or message.id != registration.message_id:
+            message = self._client.get_partial_messageable(channel_id).get_partial_message(registration.message_id)
+            self._messages[channel_id] = message
+
+        return message
+
+    async def _edit(self, channel_id: int, version: tuple) -> bool:
+        message = self._message(channel_id)
+
+        if message is None:
+            logger.warning("channel %d is not registered, skipping", channel_id)
+            return False
+
+        try:
+            queue = self._queues.channel(channel_id)
+        except KeyError:
+            # deregistered while the pass was under way
+            logger.warning("channel %d has no queue, skipping", channel_id)
+            return False
+
+        embed = discord.Embed(title="Recruitment Queue")
+        embed.add_field(name="Nations in Queue", value=self._queues.get_nation_count(channel_id))
+        embed.add_field(name="Last Updated", value=f"<t:{int(queue.last_updated.timestamp())}:R>")
+
+        from cogs.recruit import RecruitView
+
+        async with self._semaphore:
+            try:
+                await message.edit(embed=embed, view=RecruitView(self._client))
+            except discord.NotFound:
+                # not retried until the queue changes again, rather than on every pass
+                logger.warning("message: %d not found, skipping", message.id)
+                self._messages.pop(channel_id, None)
+                self._shown[channel_id] = version
+                return False
+            except discord.HTTPException as e:
+                logger.warning("Failed to edit message %d in channel %d: %s", message.id, channel_id, e)
+                return False
+
+        self._shown[channel_id] = version
+
+        return True
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import aiomysql
+
+logger = logging.getLogger("main")
+
+SPOOL_PATH = "telegram_spool.jsonl"
+FLUSH_INTERVAL = 5
+"seconds between two writes of the buffered telegrams"
+
+UNREACHABLE = (aiomysql.OperationalError, aiomysql.InterfaceError, OSError, asyncio.TimeoutError)
+"errors that mean the database could not be reached, rather than that it refused the rows"
+
+DAILY_UPSERT = """INSERT INTO telegram_daily (channelId, recruiterId, day, nationCount)
+                  VALUES (%s, %s, %s, %s)
+                  ON DUPLICATE KEY UPDATE nationCount = nationCount + VALUES(nationCount);"""
+
+REPORT_QUERY = """SELECT users.nation, SUM(daily.nationCount) AS 'tgcount', COUNT(DISTINCT daily.day) AS 'days'
+                  FROM (SELECT recruiterId, day, nationCount
+                        FROM telegram_daily
+                        WHERE channelId = %s
+                          AND day >= %s
+                          AND day < %s
+                        UNION ALL
+                        SELECT recruiterId, DATE(timestamp) AS day, nationCount
+                        FROM telegrams
+                        WHERE channelId = %s
+                          AND ((timestamp >= %s AND timestamp < %s) OR (timestamp >= %s AND timestamp <= %s))) AS daily
+                           JOIN users ON users.id = daily.recruiterId
+                  GROUP BY users.id
+                  ORDER BY tgcount DESC
+                  LIMIT 40;"""
+"""telegram counts and active days per recruiter between two times. whole days are read from the rollup, and only the
+partial days at either end from the telegrams themselves"""
+
+
+STREAKS_QUERY = """SELECT users.nation, DATEDIFF(telegram_streaks.lastDay, telegram_streaks.startDay) + 1 AS streak_days
+                   FROM telegram_streaks
+                            JOIN users ON users.id = telegram_streaks.recruiterId
+                   WHERE telegram_streaks.channelId = %s
+                     AND telegram_streaks.lastDay >= %s
+                     AND telegram_streaks.startDay <= %s
+                     AND DATEDIFF(telegram_streaks.lastDay, telegram_streaks.startDay) >= 2
+                   ORDER BY streak_days DESC
+                   LIMIT 40;"""
+"streaks of three days or more that overlap two times, longest first"
+
+REBUILD_DAILY = """INSERT INTO telegram_daily (channelId, recruiterId, day, nationCount)
+                   SELECT channelId, recruiterId, DATE(timestamp), SUM(nationCount)
+                   FROM telegrams
+                   WHERE channelId IS NOT NULL
+                   GROUP BY channelId, recruiterId, DATE(timestamp);"""
+"every telegram summed into its rollup row"
+
+REBUILD_STREAKS = """INSERT INTO telegram_streaks (channelId, recruiterId, startDay, lastDay)
+                     SELECT channelId, recruiterId, MIN(day), MAX(day)
+                     FROM (SELECT channelId,
+                                  recruiterId,
+                                  day,
+                                  DATE_SUB(day, INTERVAL ROW_NUMBER() OVER (PARTITION BY channelId, recruiterId ORDER BY day) DAY) AS island
+                           FROM telegram_daily) AS days
+                     GROUP BY channelId, recruiterId, island;"""
+"every run of consecutive active days in the rollup, as one streak row each"
+
+
+def report_params(channel_id: Optional[int], start_time: datetime, end_time: datetime) -> tuple:
+    "parameters of REPORT_QUERY for an inclusive time range"
+    first_day = datetime.combine(start_time.date(), time(), start_time.tzinfo)
+
+    if first_day < start_time:
+        first_day += timedelta(days=1)
+
+    last_day = datetime.combine(end_time.date(), time(), end_time.tzinfo)
+
+    if first_day >= last_day:
+        # no whole day in the range, so all of it is read from the telegrams
+        first_day = last_day = start_time
+
+    return (channel_id, first_day.date(), last_day.date(), channel_id, start_time, first_day, last_day, end_time)
+
+
+class TelegramBuffer:
+    """write-behind buffer for telegram records, so that a click never waits on the telegrams table.
+
+    records are written every few seconds as one multi-row insert. while the database cannot be reached they are spooled
+    to a local file, one JSON array per line, and the spool is written ahead of the buffer on the next flush that gets
+    through. each record keeps the time of its click, so reports are unaffected by when it is written. if the database
+    refuses a batch, its rows are written one at a time so that only the rows it refuses on their own are set aside.
+
+    the telegram_daily rollup and the telegram_streaks runs of consecutive active days are updated in the same
+    transaction, so they never disagree with the telegrams table"""
+
+    _pool: aiomysql.Pool
+    _pending: List[list]
+    "[recruiter id, nation count, internal channel id, epoch] for each telegram that has not been written yet"
+    _spool_path: str
+    _rejected_path: str
+    "telegrams the database refused on their own, kept for a look by hand rather than retried"
+    _lock: asyncio.Lock
+    "one flush at a time, between the flush loop and reports"
+    _flush_task: Optional[asyncio.Task]
+    _last_day: Dict[Tuple[int, int], date]
+    "last day written to the streaks of each channel and recruiter, so that their later telegrams that day skip the lookup"
+
+    def __init__(self, pool: aiomysql.Pool, spool_path: str = SPOOL_PATH):
+        self._pool = pool
+        self._pending = []
+        self._last_day = {}
+        self._spool_path = spool_path
+        self._rejected_path = f"{os.path.splitext(spool_path)[0]}.rejected.jsonl"
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+
+    def __repr__(self):
+        return f"<TelegramBuffer pending={len(self._pending)}>"
+
+    def add(self, recruiter_id: int, nation_count: int, channel_id: int):
+        self._pending.append([recruiter_id, nation_count, channel_id, datetime.now(timezone.utc).timestamp()])
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        "stop the flush loop and write, or spool, whatever is still buffered"
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            spooled = self._read_spool()
+            rows = spooled + pending
+
+            if not rows:
+                return
+
+            try:
+                await self._insert(rows)
+            except UNREACHABLE as e:
+                logger.warning("Database unreachable, spooling %d telegrams: %s", len(pending), e)
+                self._spool(pending)
+                return
+            except Exception:
+                logger.exception("error while writing %d telegrams, writing them one at a time", len(rows))
+                self._rewrite_spool(await self._insert_each(rows))
+                return
+
+            if spooled:
+                os.remove(self._spool_path)
+                logger.info("Wrote %d spooled telegrams.", len(spooled))
+
+    async def _insert_each(self, rows: List[list]) -> List[list]:
+        """write rows one at a time after the database refused them as a batch, returning the rows left unwritten.
+
+        the rows the database refuses on their own are moved to the rejected file, and the rest are written. if the
+        database stops being reachable part way, the rows not tried yet are returned"""
+        for i, row in enumerate(rows):
+            try:
+                await self._insert([row])
+            except UNREACHABLE as e:
+                logger.warning("Database unreachable, spooling %d telegrams: %s", len(rows) - i, e)
+                return rows[i:]
+            except Exception as e:
+                logger.error("Telegram %s was refused, moving it to %s: %s", row, self._rejected_path, e)
+                self._spool([row], self._rejected_path)
+
+        return []
+
+    async def _insert(self, rows: List[list]):
+        values = [
+            (recruiter_id, nation_count, channel_id, datetime.fromtimestamp(timestamp, timezone.utc))
+            for recruiter_id, nation_count, channel_id, timestamp in rows
+        ]
+
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await conn.begin()
+
+                try:
+                    # executemany folds rows of a plain VALUES list into a single multi-row insert
+                    await cur.executemany(
+                        "INSERT INTO telegrams (recruiterId, nationCount, channelId, timestamp) VALUES (%s, %s, %s, %s);", values
+                    )
+                    await cur.executemany(DAILY_UPSERT, daily := self._daily(values))
+
+                    days = sorted({(channel_id, recruiter_id, day) for channel_id, recruiter_id, day, _count in daily}, key=lambda d: d[2])
+                    days = [
+                        (channel_id, recruiter_id, day)
+                        for channel_id, recruiter_id, day in days
+                        if self._last_day.get((channel_id, recruiter_id)) != day
+                    ]
+
+                    for channel_id, recruiter_id, day in days:
+                        await self._record_day(cur, channel_id, recruiter_id, day)
+                except BaseException:
+                    await conn.rollback()
+                    raise
+
+                await conn.commit()
+
+        for channel_id, recruiter_id, day in days:
+            self._last_day[channel_id, recruiter_id] = day
+
+    @staticmethod
+    async def _record_day(cur: aiomysql.Cursor, channel_id: int, recruiter_id: int, day: date):
+        "add an active day to a recruiter's streaks, extending or joining the streaks either side of it"
+        await cur.execute(
+            """SELECT id, startDay, lastDay
+               FROM telegram_streaks
+               WHERE channelId = %s
+                 AND recruiterId = %s
+                 AND lastDay >= %s
+                 AND startDay <= %s;""",
+            (channel_id, recruiter_id, day - timedelta(days=1), day + timedelta(days=1)),
+        )
+        streaks = await cur.fetchall()
+
+        if any(start <= day <= last for _id, start, last in streaks):
+            return
+
+        before = next((streak for streak in streaks if streak[2] == day - timedelta(days=1)), None)
+        after = next((streak for streak in streaks if streak[1] == day + timedelta(days=1)), None)
+
+        if before and after:
+            await cur.execute("UPDATE telegram_streaks SET lastDay = %s WHERE id = %s;", (after[2], before[0]))
+            await cur.execute("DELETE FROM telegram_streaks WHERE id = %s;", (after[0],))
+        elif before:
+            await cur.execute("UPDATE telegram_streaks SET lastDay = %s WHERE id = %s;", (day, before[0]))
+        elif after:
+            await cur.execute("UPDATE telegram_streaks SET startDay = %s WHERE id = %s;", (day, after[0]))
+        else:
+            await cur.execute(
+                "INSERT INTO telegram_streaks (channelId, recruiterId, startDay, lastDay) VALUES (%s, %s, %s, %s);",
+                (channel_id, recruiter_id, day, day),
+            )
+
+    @staticmethod
+    def _daily(values: List[tuple]) -> List[tuple]:
+        "the telegram rows summed into their rollup rows, by channel, recruiter and UTC day"
+        totals: defaultdict[tuple[int, int, date], int] = defaultdict(int)
+
+        for recruiter_id, nation_count, channel_id, timestamp in values:
+            totals[channel_id, recruiter_id, timestamp.date()] += nation_count
+
+        return [(*key, nation_count) for key, nation_count in totals.items()]
+
+    async def rebuild(self):
+        "rebuild the telegram_daily rollup and the streaks from the telegrams table, which also backfills them the first time"
+        async with self._lock:
+            async with self._pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await conn.begin()
+
+                    try:
+                        await cur.execute("DELETE FROM telegram_daily;")
+                        await cur.execute(REBUILD_DAILY)
+                        await cur.execute("DELETE FROM telegram_streaks;")
+                        await cur.execute(REBUILD_STREAKS)
+                    except BaseException:
+                        await conn.rollback()
+                        raise
+
+                    await conn.commit()
+
+            self._last_day = {}
+
+    def _spool(self, rows: List[list], path: Optional[str] = None):
+        try:
+            with open(path or self._spool_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(row) + "\n" for row in rows))
+        except OSError as e:
+            logger.error("Failed to spool %d telegrams: %s", len(rows), e)
+
+    def _rewrite_spool(self, rows: List[list]):
+        "replace the spool with the given rows, removing it when there are none"
+        try:
+            if rows:
+                with open(f"{self._spool_path}.tmp", "w", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(row) + "\n" for row in rows))
+
+                os.replace(f"{self._spool_path}.tmp", self._spool_path)
+            elif os.path.exists(self._spool_path):
+                os.remove(self._spool_path)
+        except OSError as e:
+            logger.error("Failed to rewrite the telegram spool with %d telegrams: %s", len(rows), e)
+
+    def _read_spool(self) -> List[list]:
+        try:
+            with open(self._spool_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+
+        rows = []
+
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # only the last line can be torn, by a crash in the middle of a write
+                logger.warning("Skipping a torn line in the telegram spool.")
+
+        return rows
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("error while flushing telegrams")
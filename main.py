@@ -14,6 +14,7 @@ except ConfigError as e:
     sys.exit(1)
 
 from components.bot import Bot
+from components.migrations import migrate
 from components.queue import QueueManager
 
 logger = logging.getLogger("main")
@@ -35,7 +36,16 @@ async def main():
         )
 
         try:
-            async with QueueManager(pool) as ql:
+            await migrate(pool)
+
+            async with QueueManager(
+                pool,
+                configInstance.data.ingestion_mode,
+                configInstance.data.batch_window,
+                configInstance.data.batch_size,
+                queue_cap=configInstance.data.queue_cap,
+                memory_budget=configInstance.data.memory_budget * 1024 * 1024,
+            ) as ql:
                 async with Bot(session, ql, pool) as bot:
                     if sys.platform != "win32":
                         loop = asyncio.get_running_loop()
@@ -0,0 +1,117 @@
+"""The global puppet filters: combined verdicts, the verdict cache and per-pattern statistics.
+
+uv run -m unittest tests.test_filters
+"""
+
+import random
+import re
+import unittest
+
+from components.filters import PROFILE_SAMPLE_RATE, UNCOMBINABLE_REGEX, FilterEngine
+
+PATTERNS = [
+    r"^\d+_[a-z0-9_]+",
+    r"[a-z0-9_]+_\d+$",
+    r"^puppet",
+    r"^([a-z])\1",
+    r"^(?P<start>[a-z]{2}).*(?P=start)$",
+    r"^(x)?(?(1)y|z)",
+    r"(?i)^ALT",
+]
+"the last four use a backreference, a named backreference, a conditional and a global inline flag"
+
+
+def names(count: int) -> list[str]:
+    rnd = random.Random(0)
+    alphabet = "abcdxyz019_"
+
+    return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(3, 10))) for _ in range(count)] + [
+        "puppet_farm",
+        "aardvark",
+        "abcab",
+        "xylophone",
+        "zebra",
+        "alt_nation",
+        "ALTERNATIVE",
+        "12_nations",
+        "nation_12",
+    ]
+
+
+class FilterEngineTest(unittest.TestCase):
+    patterns: list[re.Pattern]
+
+    def setUp(self):
+        self.patterns = [re.compile(pattern) for pattern in PATTERNS]
+
+    def test_uncombinable_patterns(self):
+        self.assertEqual([bool(UNCOMBINABLE_REGEX.search(p.pattern)) for p in self.patterns], [False] * 3 + [True] * 4)
+
+        engine = FilterEngine(self.patterns)
+        self.assertEqual(len(engine._standalone), 4)
+
+    def test_verdicts_match_each_pattern_in_turn(self):
+        engine = FilterEngine(self.patterns, cache_size=64)
+
+        # twice, so the second round is answered partly from the cache
+        for _ in range(2):
+            for name in names(2000):
+                with self.subTest(name=name):
+                    self.assertEqual(engine.match(name), any(p.match(name) for p in self.patterns))
+
+    def test_pattern_with_flags_is_matched_on_its_own(self):
+        pattern = re.compile(r"^caps", re.IGNORECASE)
+        engine = FilterEngine([*self.patterns[:3], pattern])
+
+        self.assertIn(pattern, engine._standalone)
+        self.assertTrue(engine.match("CAPS_nation"))
+
+    def test_cache_cleared_when_filters_change(self):
+        engine = FilterEngine(self.patterns[:3])
+        added = re.compile(r"^cached")
+
+        self.assertFalse(engine.match("cached_nation"))
+
+        engine.add(added)
+        self.assertTrue(engine.match("cached_nation"))
+
+        engine.remove(added)
+        self.assertFalse(engine.match("cached_nation"))
+        self.assertNotIn(added.pattern, engine.stats())
+
+    def test_hits_credited_to_the_first_matching_pattern(self):
+        engine = FilterEngine(self.patterns)
+
+        # both of the first two patterns match, and the first is credited, for the cached verdict too
+        engine.match("12_nation_34")
+        engine.match("12_nation_34")
+        # only the standalone backreference pattern matches
+        engine.match("aardvark")
+        engine.match("zebra")
+        engine.match("ordinary")
+
+        hits = {pattern: stats.hits for pattern, stats in engine.stats().items()}
+
+        self.assertEqual(hits[PATTERNS[0]], 2)
+        self.assertEqual(hits[PATTERNS[1]], 0)
+        self.assertEqual(hits[PATTERNS[3]], 1)
+        self.assertEqual(hits[PATTERNS[5]], 1)
+        self.assertEqual(sum(hits.values()), 4)
+
+    def test_sampled_evaluations(self):
+        engine = FilterEngine(self.patterns)
+
+        for i in range(PROFILE_SAMPLE_RATE * 3):
+            engine.match(f"sample_{i}")
+
+        # the cache answers repeats without evaluating them again
+        engine.match("sample_0")
+
+        for stats in engine.stats().values():
+            self.assertEqual(stats.evaluations, 3)
+            self.assertGreater(stats.match_time, 0)
+            self.assertGreaterEqual(stats.match_time, stats.max_match_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,273 @@
+"""Handouts that are held while a recruiter's claim is recorded, across snapshots, restarts and failed claims.
+
+uv run -m unittest tests.test_handout
+"""
+
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+from components.channel import RecruitmentChannel
+from components.errors import LastRecruitmentTooRecent
+from components.parser import FoundingEvent, MoveEvent
+from components.queue import QueueManager
+from components.recruiter import Recruiter
+from components.telegrams import TelegramBuffer
+
+CHANNEL = 1
+WHITELISTED = "home"
+USER = SimpleNamespace(id=5, name="recruiter")
+
+SETTINGS = {
+    "db_host": "localhost",
+    "db_port": 3306,
+    "db_user": "",
+    "db_password": "",
+    "db_name": "ns",
+    "operator": "tests",
+    "polling_rate": 15,
+    "period_max": 5,
+    "bot_token": "",
+    "global_administrators": [],
+}
+
+
+class QueueCase(unittest.TestCase):
+    "a channel of 20 queued nations, with its journal and snapshot in a scratch directory"
+
+    directory: str
+    manager: QueueManager
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = temporary.name
+        self.manager = self.make_manager()
+        self.addCleanup(self.manager._journal.close)
+
+        now = int(time.time())
+
+        for i in range(20):
+            self.manager._handle_founding(FoundingEvent(f"nation_{i}", "elsewhere", now, str(i)))
+
+    def make_manager(self) -> QueueManager:
+        manager = QueueManager(None, batch_window=0, journal_path=os.path.join(self.directory, "queue_journal.{}.jsonl"))
+        manager.add_channel(CHANNEL, [WHITELISTED])
+
+        return manager
+
+    def save(self):
+        self.manager._save_to_disk(os.path.join(self.directory, "queue_state.bin"))
+
+    def reload(self) -> list[str]:
+        "the queue a restart would come back with"
+        manager = self.make_manager()
+        manager._load_from_disk(os.path.join(self.directory, "queue_state.bin"), os.path.join(self.directory, "queue_state.json"))
+
+        return manager.channel(CHANNEL).get_nation_names()
+
+    def queued(self) -> list[str]:
+        return self.manager.channel(CHANNEL).get_nation_names()
+
+
+class HandoutTest(QueueCase):
+    def test_given_back_after_snapshot(self):
+        self.save()
+        before = self.queued()
+
+        handout = self.manager.hand_out(None, CHANNEL)
+        self.manager.give_back(handout)
+
+        self.assertEqual(self.queued(), before)
+        self.assertEqual(self.reload(), before)
+
+    def test_committed_after_snapshot(self):
+        self.save()
+        before = self.queued()
+
+        handout = self.manager.hand_out(None, CHANNEL)
+        self.manager.commit(handout)
+
+        self.assertEqual(handout.names, before[:8])
+        self.assertEqual(self.reload(), before[8:])
+
+    def test_snapshot_while_held(self):
+        self.save()
+        before = self.queued()
+
+        handout = self.manager.hand_out(None, CHANNEL)
+        self.save()
+
+        # a restart before the claim settles puts the nations back
+        self.assertEqual(self.reload(), before)
+
+        self.manager.give_back(handout)
+        self.assertEqual(self.reload(), before)
+
+    def test_committed_after_snapshot_while_held(self):
+        self.save()
+        before = self.queued()
+
+        handout = self.manager.hand_out(None, CHANNEL)
+        self.save()
+        self.manager.commit(handout)
+
+        self.assertEqual(self.reload(), before[8:])
+
+    def test_moved_away_while_held(self):
+        self.save()
+        before = self.queued()
+
+        handout = self.manager.hand_out(None, CHANNEL)
+        moved = handout.names[0]
+        self.manager._handle_move(MoveEvent(moved, "elsewhere", WHITELISTED, int(time.time()), "moved"))
+        self.save()
+        self.manager.give_back(handout)
+
+        expected = [name for name in before if name != moved]
+        self.assertEqual(self.queued(), expected)
+        self.assertEqual(self.reload(), expected)
+
+
+def import_bot() -> type:
+    "components.bot reads settings.json from the working directory when it is first imported"
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        with open(os.path.join(directory, "settings.json"), "w") as f:
+            json.dump(SETTINGS, f)
+
+        os.chdir(directory)
+
+        try:
+            return importlib.import_module("components.bot").Bot
+        finally:
+            os.chdir(cwd)
+
+
+Bot = import_bot()
+
+
+class Cursor:
+    def __init__(self, pool: "Pool"):
+        self._pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query: str, args: tuple = ()) -> int:
+        self._pool.queries.append(query.split()[0])
+
+        if self._pool.error is not None:
+            raise self._pool.error
+
+        return 1 if self._pool.allow_recruitment_at is None else 0
+
+    async def fetchone(self) -> tuple:
+        return (self._pool.allow_recruitment_at.replace(tzinfo=None),)
+
+
+class Connection:
+    def __init__(self, pool: "Pool"):
+        self._pool = pool
+
+    def cursor(self) -> Cursor:
+        return Cursor(self._pool)
+
+
+class Pool:
+    "the users table of one recruiter, whose cooldown in the database runs out at allow_recruitment_at"
+
+    allow_recruitment_at: Optional[datetime]
+    "None when the cooldown has run out, so the claim goes through"
+    error: Optional[Exception]
+    queries: list[str]
+
+    def __init__(self, allow_recruitment_at: Optional[datetime] = None, error: Optional[Exception] = None):
+        self.allow_recruitment_at = allow_recruitment_at
+        self.error = error
+        self.queries = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield Connection(self)
+
+
+class StubBot:
+    "just enough of Bot to hand out nations, with its claim and response code"
+
+    claim_recruitment = Bot.claim_recruitment
+    create_recruitment_response = Bot.create_recruitment_response
+    _internal_id = Bot._internal_id
+
+    def __init__(self, queues: QueueManager, pool: Pool):
+        self._queue_list = queues
+        self._pool = pool
+        self._telegrams = TelegramBuffer(pool)
+        self.recruiter = Recruiter(7, "recruiter", "template", USER.id, CHANNEL, datetime.now(timezone.utc), datetime.now(timezone.utc))
+
+    async def get_recruiter(self, user, channel_id: int) -> Recruiter:
+        return self.recruiter
+
+
+class ClaimTest(QueueCase):
+    def setUp(self):
+        super().setUp()
+        self.manager.put_recruitment_channel(RecruitmentChannel(3, CHANNEL, 100, 200, False))
+        self.save()
+
+    def test_claimed(self):
+        before = self.queued()
+        bot = StubBot(self.manager, Pool())
+
+        asyncio.run(bot.create_recruitment_response(USER, CHANNEL))
+
+        self.assertEqual(bot._pool.queries, ["UPDATE"])
+        self.assertGreater(bot.recruiter.next_recruitment_at, datetime.now(timezone.utc))
+        self.assertEqual(bot._telegrams._pending[0][:3], [7, 8, 3])
+        self.assertEqual(self.queued(), before[8:])
+        self.assertEqual(self.reload(), before[8:])
+
+    def test_cooldown_in_database(self):
+        before = self.queued()
+        allow_recruitment_at = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=30)
+        bot = StubBot(self.manager, Pool(allow_recruitment_at))
+
+        with self.assertRaises(LastRecruitmentTooRecent):
+            asyncio.run(bot.create_recruitment_response(USER, CHANNEL))
+
+        # the nations go back without being journaled, and the recruiter takes the cooldown from the database
+        self.assertEqual(bot._pool.queries, ["UPDATE", "SELECT"])
+        self.assertEqual(bot.recruiter.next_recruitment_at, allow_recruitment_at)
+        self.assertEqual(bot._telegrams._pending, [])
+        self.assertEqual(self.queued(), before)
+        self.assertEqual(self.reload(), before)
+
+    def test_claim_failed(self):
+        before = self.queued()
+        bot = StubBot(self.manager, Pool(error=ConnectionError("database unreachable")))
+        previous = bot.recruiter.next_recruitment_at
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(bot.create_recruitment_response(USER, CHANNEL))
+
+        self.assertEqual(bot.recruiter.next_recruitment_at, previous)
+        self.assertEqual(bot._telegrams._pending, [])
+        self.assertEqual(self.queued(), before)
+        self.assertEqual(self.reload(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Recovery from a snapshot plus the journal written since, across journal rotations.
+
+uv run -m unittest tests.test_journal
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from components.parser import FoundingEvent, MoveEvent
+from components.queue import QueueManager
+
+CHANNELS = 3
+
+
+class JournalTest(unittest.TestCase):
+    directory: str
+    manager: QueueManager
+    founded: int
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = temporary.name
+        self.manager = self.make_manager()
+        self.addCleanup(self.manager._journal.close)
+        self.founded = 0
+
+    def make_manager(self) -> QueueManager:
+        manager = QueueManager(None, batch_window=0, journal_path=os.path.join(self.directory, "queue_journal.{}.jsonl"))
+
+        for channel_id in range(CHANNELS):
+            manager.add_channel(channel_id, [f"region_{channel_id}"])
+
+        return manager
+
+    def path(self, name: str = "queue_state.bin") -> str:
+        return os.path.join(self.directory, name)
+
+    def found(self, count: int):
+        now = int(time.time())
+
+        for _ in range(count):
+            i = self.founded
+            self.manager._last_event_id = str(i)
+            self.manager._handle_founding(FoundingEvent(f"nation_{i}", f"region_{i % 5}", now, str(i)))
+            self.founded += 1
+
+    def recruit(self, channel_id: int):
+        self.manager.commit(self.manager.hand_out(None, channel_id))
+
+    def assertRecovers(self):
+        "a fresh manager loading the snapshot and replaying the journal ends up where this one is"
+        manager = self.make_manager()
+        manager._load_from_disk(self.path(), self.path("queue_state.json"))
+
+        self.assertEqual(manager._last_event_id, self.manager._last_event_id)
+
+        for channel_id in range(CHANNELS):
+            with self.subTest(channel=channel_id):
+                self.assertEqual(manager.channel(channel_id).get_nation_names(), self.manager.channel(channel_id).get_nation_names())
+
+    def test_snapshot_and_tail(self):
+        self.manager._save_to_disk(self.path())
+        self.found(30)
+        self.recruit(0)
+
+        # the second snapshot covers the first generation, which is discarded once it is written
+        self.manager._save_to_disk(self.path())
+        self.assertEqual(self.manager._journal.generations(), [2])
+
+        self.found(20)
+        self.recruit(1)
+        self.manager._handle_move(MoveEvent("nation_45", "region_0", "region_2", int(time.time()), "move"))
+        self.recruit(2)
+
+        self.assertRecovers()
+
+    def test_failed_snapshot_keeps_older_generations(self):
+        self.manager._save_to_disk(self.path())
+        self.found(30)
+        self.recruit(0)
+
+        # the journal still rotates, but nothing is discarded, so the first snapshot replays both generations
+        self.assertFalse(self.manager._write_snapshot(self.manager._capture_snapshot(), self.path(os.path.join("missing", "state.bin"))))
+        self.assertEqual(self.manager._journal.generations(), [1, 2])
+
+        self.found(20)
+        self.recruit(1)
+
+        self.assertRecovers()
+
+    def test_discard_before(self):
+        for _ in range(3):
+            self.manager._journal.rotate()
+            self.found(1)
+
+        self.assertEqual(self.manager._journal.generations(), [1, 2, 3])
+
+        self.manager._journal.discard_before(3)
+
+        self.assertEqual(self.manager._journal.generations(), [3])
+        self.assertEqual([record[0] for record in self.manager._journal.replay()], ["f", "e"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""The fast-path feed event parser, against a full JSON decode.
+
+uv run -m unittest tests.test_parser
+"""
+
+import json
+import unittest
+from typing import Optional
+
+from benchmarks.corpus import generate
+from components.parser import FOUNDING_REGEX, MOVE_REGEX, FoundingEvent, MoveEvent, _fields, _int_field, _string_field, parse
+
+FOUNDING = "@@new_nation@@ was founded in %%the_north_pacific%%."
+MOVE = "@@new_nation@@ relocated from %%the_north_pacific%% to %%europeia%%."
+MALFORMED = (ValueError, KeyError, TypeError)
+"what decoding an event that is not json, or lacks or mistypes a field, raises"
+
+
+def decoded(data: str) -> Optional[tuple[str, str, int]]:
+    "the str, id and time fields as json.loads reads them"
+    try:
+        event = json.loads(data)
+        return event["str"], str(event["id"]), int(event["time"])
+    except MALFORMED:
+        return None
+
+
+def parsed(data: str) -> Optional[FoundingEvent | MoveEvent]:
+    "the event parse should return, worked out from a full decode"
+    if (fields := decoded(data)) is None:
+        return None
+
+    text, event_id, timestamp = fields
+
+    if match := FOUNDING_REGEX.match(text):
+        return FoundingEvent(match[1], match[2], timestamp, event_id)
+
+    if match := MOVE_REGEX.match(text):
+        return MoveEvent(match[1], match[2], match[3], timestamp, event_id)
+
+    return None
+
+
+CASES = {
+    "plain": json.dumps({"id": "1", "time": 1700000000, "str": FOUNDING, "htmlStr": "<a>new nation</a>"}),
+    "reordered": json.dumps({"htmlStr": "<a>", "time": 1700000000, "str": FOUNDING, "id": "2"}),
+    "spaced": '{ "str" : "%s", "id" : "3", "time" : 1700000000 }' % FOUNDING,
+    "escaped str": json.dumps({"str": FOUNDING + ' "quoted"', "id": "4", "time": 1700000000}),
+    "escaped unicode": json.dumps({"str": "@@café@@ was founded in %%b%%.", "id": "5", "time": 1700000000}),
+    "keys quoted in htmlStr": json.dumps(
+        {"htmlStr": '"str":"@@decoy@@ was founded in %%x%%." "id":"0" "time":0', "str": FOUNDING, "id": "6", "time": 1700000000}
+    ),
+    "numeric id": json.dumps({"str": FOUNDING, "id": 7, "time": 1700000000}),
+    "string time": json.dumps({"str": FOUNDING, "id": "8", "time": "1700000000"}),
+    "float time": json.dumps({"str": FOUNDING, "id": "9", "time": 1700000000.5}),
+    "null time": json.dumps({"str": FOUNDING, "id": "10", "time": None}),
+    "missing str": json.dumps({"id": "11", "time": 1700000000, "htmlStr": FOUNDING}),
+    "missing id": json.dumps({"str": FOUNDING, "time": 1700000000}),
+    "missing time": json.dumps({"str": FOUNDING, "id": "12"}),
+    "truncated": json.dumps({"str": FOUNDING, "id": "13", "time": 1700000000})[:-10],
+    "move": json.dumps({"id": "14", "time": 1700000000, "str": MOVE}),
+}
+
+
+class ParserTest(unittest.TestCase):
+    def test_fields_agree_with_json(self):
+        for name, data in CASES.items():
+            with self.subTest(name):
+                self.assertEqual(_fields(data), decoded(data))
+
+    def test_events_agree_with_json(self):
+        for name, data in CASES.items():
+            with self.subTest(name):
+                self.assertEqual(parse(data), parsed(data))
+
+    def test_fast_path_defers_to_json(self):
+        # escapes and missing fields are left to the full decode rather than read wrongly
+        self.assertEqual(_string_field(CASES["plain"], "str"), FOUNDING)
+        self.assertIsNone(_string_field(CASES["escaped str"], "str"))
+        self.assertIsNone(_string_field(CASES["escaped unicode"], "str"))
+        self.assertIsNone(_string_field(CASES["missing id"], "id"))
+        self.assertIsNone(_string_field(CASES["numeric id"], "id"))
+        self.assertIsNone(_int_field(CASES["float time"], "time"))
+        self.assertEqual(_int_field(CASES["string time"], "time"), 1700000000)
+
+    def test_corpus(self):
+        for data in generate(2000, seed=3):
+            self.assertEqual(parse(data), parsed(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
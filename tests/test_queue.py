@@ -0,0 +1,129 @@
+"""Queues over the shared founding log: compaction, eviction and move handling.
+
+uv run -m unittest tests.test_queue
+"""
+
+import time
+import unittest
+
+from components.parser import FoundingEvent
+from components.queue import IDLE_AFTER, RANGE_BYTES, SKIPPED_BYTES, FoundingLog, Nation, Queue, QueueManager
+
+
+def make_queue(regions: list[str], whitelist: list[str]) -> Queue:
+    "a queue over a log of one founding per region, in order"
+    log = FoundingLog()
+    queue = Queue(log, whitelist)
+    now = int(time.time())
+
+    for i, region in enumerate(regions):
+        queue.handle_founding(log.append(Nation(f"nation_{i}", region, now)), Nation(f"nation_{i}", region, now))
+
+    return queue
+
+
+class CompactTest(unittest.TestCase):
+    def test_scattered_skips_are_kept(self):
+        # every other founding is skipped, so compacting would leave a range per founding
+        queue = make_queue(["home", "away"] * 100, ["home"])
+        names = queue.get_nation_names()
+
+        self.assertFalse(queue.compact())
+        self.assertEqual(queue.get_nation_names(), names)
+        self.assertEqual(queue.estimated_bytes(), RANGE_BYTES + 100 * SKIPPED_BYTES)
+
+    def test_clustered_skips_are_compacted(self):
+        queue = make_queue(["away"] * 50 + ["home"] * 100 + ["away"] * 50, ["home"])
+        names = queue.get_nation_names()
+
+        self.assertTrue(queue.compact())
+        self.assertEqual(queue.get_nation_names(), names)
+        self.assertEqual(queue.get_nation_count(), 100)
+        self.assertEqual(queue.estimated_bytes(), 2 * RANGE_BYTES)
+
+
+class EvictTest(unittest.TestCase):
+    def make_manager(self, max_ages: list[int], idle: int, ages: list[int]) -> QueueManager:
+        "a manager with a channel per max age, of which channel idle has not handed out in a while, and a founding per age"
+        manager = QueueManager(None, batch_window=0, memory_budget=1 << 40)
+
+        for channel_id, max_age in enumerate(max_ages):
+            manager.add_channel(channel_id, [], max_age)
+
+        manager.channel(idle)._last_handout -= IDLE_AFTER + 1
+        now = int(time.time())
+
+        for i, age in enumerate(ages):
+            manager._handle_founding(FoundingEvent(f"nation_{i}", "region", now - age, str(i)))
+
+        manager.expire()
+
+        return manager
+
+    def counts(self, manager: QueueManager) -> list[int]:
+        return [manager.get_nation_count(channel_id) for channel_id in sorted(manager._queues)]
+
+    def test_idle_queue_kept_when_the_log_is_pinned(self):
+        manager = self.make_manager([3600] * 3, 2, [0] * 1000)
+        manager._memory_budget = 20_000
+
+        # every queue holds the oldest founding, so evicting only the idle one would free nothing
+        self.assertEqual(manager._evict_over_budget(manager._queues, idle=True), [])
+        self.assertEqual(self.counts(manager), [1000] * 3)
+
+        manager.expire()
+        counts = self.counts(manager)
+
+        self.assertEqual(len(set(counts)), 1)
+        self.assertLess(counts[0], 1000)
+        self.assertLessEqual(manager.estimated_bytes(), manager.memory_budget)
+
+    def test_idle_queue_evicted_up_to_the_active_queues(self):
+        # the active channels have already let go of the 500 older foundings, which only the idle channel still holds
+        manager = self.make_manager([600, 600, 3600], 2, [1200] * 500 + [0] * 500)
+        self.assertEqual(self.counts(manager), [500, 500, 1000])
+
+        manager._memory_budget = manager.estimated_bytes() - 100 * int(manager._log.bytes_per_nation)
+        manager.expire()
+        counts = self.counts(manager)
+
+        self.assertEqual(counts[:2], [500, 500])
+        self.assertGreaterEqual(counts[2], 500)
+        self.assertLess(counts[2], 1000)
+        self.assertLessEqual(manager.estimated_bytes(), manager.memory_budget)
+
+
+class MoveTest(unittest.TestCase):
+    def test_only_a_skip_counts_as_an_update(self):
+        queue = make_queue(["away"] * 10, ["home"])
+        version, last_updated = queue.version, queue._last_updated
+
+        # nations that were never queued here, or have already been skipped, leave the queue as it was
+        queue.handle_move("unknown_nation", "home")
+        queue.handle_move("nation_3", "elsewhere")
+        self.assertEqual((queue.version, queue._last_updated), (version, last_updated))
+
+        queue.handle_move("nation_3", "home")
+        self.assertNotEqual(queue.version, version)
+        self.assertGreater(queue._last_updated, last_updated)
+        self.assertEqual(queue.get_nation_count(), 9)
+
+        version, last_updated = queue.version, queue._last_updated
+        queue.handle_move("nation_3", "home")
+        self.assertEqual((queue.version, queue._last_updated), (version, last_updated))
+
+    def test_held_nation_moved(self):
+        queue = make_queue(["away"] * 10, ["home"])
+        seqs = queue.hold(None, 2)
+        version = queue.version
+
+        # the nation is already out of the queue, and is not given back
+        queue.handle_move("nation_9", "home")
+        self.assertEqual(queue.version, version)
+
+        queue.give_back(seqs)
+        self.assertEqual(queue.get_nation_names(), [f"nation_{i}" for i in range(8, -1, -1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
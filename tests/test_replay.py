@@ -0,0 +1,118 @@
+"""Replays a feed corpus through both ingestion modes and checks each channel's queue against the corpus.
+
+tests/data/feed_corpus.jsonl is synthetic, the output of benchmarks.corpus.generate(1200, seed=11, duration=1200)
+followed by its last 40 events again, as the feed replays them after a reconnect. It is saved rather than generated on
+each run, since generate stamps events with the current time.
+
+uv run -m unittest tests.test_replay
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import unittest
+
+from httpx_sse import ServerSentEvent
+
+from benchmarks.corpus import REGIONS, load
+from components.queue import QueueManager
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "feed_corpus.jsonl")
+CHANNELS = 20
+BATCH_SIZE = 50
+"small enough that the corpus is applied in many batches, with moves folded into foundings of the same batch"
+
+FOUNDING = re.compile(r"@@(.+?)@@ was founded in %%(.+?)%%\.")
+MOVE = re.compile(r"@@(.+?)@@ relocated from %%(.+?)%% to %%(.+?)%%\.")
+
+
+def whitelists() -> dict[int, list[str]]:
+    rnd = random.Random(0)
+
+    return {channel_id: rnd.sample(REGIONS, 20) for channel_id in range(CHANNELS)}
+
+
+def expected_queue(corpus: list[str], whitelist: list[str]) -> list[str]:
+    "the nations a channel should hand out, newest first, worked out from the corpus alone"
+    seen = set()
+    founded = []
+    skipped = set()
+
+    for data in corpus:
+        event = json.loads(data)
+
+        if event["id"] in seen:
+            continue
+
+        seen.add(event["id"])
+
+        if match := FOUNDING.fullmatch(event["str"]):
+            nation, region = match.groups()
+            founded.append(nation)
+
+            if region in whitelist:
+                skipped.add(nation)
+        elif (match := MOVE.fullmatch(event["str"])) and match[3] in whitelist:
+            skipped.add(match[1])
+
+    return [nation for nation in reversed(founded) if nation not in skipped]
+
+
+def make_manager(mode: str) -> QueueManager:
+    manager = QueueManager(None, mode, batch_window=0.25, batch_size=BATCH_SIZE)
+
+    for channel_id, whitelist in whitelists().items():
+        manager.add_channel(channel_id, whitelist)
+
+    return manager
+
+
+class ReplayTest(unittest.TestCase):
+    corpus: list[str]
+    events: list[ServerSentEvent]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = load(CORPUS)
+        cls.events = [ServerSentEvent(data=data) for data in cls.corpus]
+
+    def assertQueues(self, manager: QueueManager):
+        for channel_id, whitelist in whitelists().items():
+            with self.subTest(channel=channel_id):
+                self.assertEqual(manager.channel(channel_id).get_nation_names(), expected_queue(self.corpus, whitelist))
+
+    def test_thread_mode(self):
+        manager = make_manager("thread")
+        thread = threading.Thread(target=manager._consume, args=(iter(self.events),))
+        thread.start()
+        thread.join()
+        manager.flush()
+
+        self.assertQueues(manager)
+
+    def test_async_mode(self):
+        manager = make_manager("async")
+
+        async def feed():
+            for event in self.events:
+                yield event
+
+        asyncio.run(manager._aconsume(feed()))
+        manager.flush()
+
+        self.assertQueues(manager)
+
+    def test_replayed_events_are_dropped(self):
+        manager = make_manager("thread")
+        manager._consume(iter(self.events))
+        manager._consume(iter(self.events[-40:]))
+        manager.flush()
+
+        self.assertQueues(manager)
+
+
+if __name__ == "__main__":
+    unittest.main()
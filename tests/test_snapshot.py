@@ -0,0 +1,95 @@
+"""Binary queue snapshots, whole and truncated.
+
+uv run -m unittest tests.test_snapshot
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from components.parser import FoundingEvent
+from components.queue import QueueManager
+from components.snapshot import Snapshot, SnapshotError
+
+CHANNELS = 3
+
+
+class SnapshotTest(unittest.TestCase):
+    directory: str
+    path: str
+    expected: dict[int, list[str]]
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = temporary.name
+        self.path = os.path.join(self.directory, "queue_state.bin")
+
+        manager = self.make_manager()
+        now = int(time.time())
+
+        for i in range(200):
+            manager._handle_founding(FoundingEvent(f"nation_{i}", f"region_{i % 7}", now, str(i)))
+
+        manager._save_to_disk(self.path)
+        manager._journal.close()
+        self.expected = {channel_id: manager.channel(channel_id).get_nation_names() for channel_id in range(CHANNELS)}
+
+    def make_manager(self) -> QueueManager:
+        manager = QueueManager(None, batch_window=0, journal_path=os.path.join(self.directory, "queue_journal.{}.jsonl"))
+
+        for channel_id in range(CHANNELS):
+            manager.add_channel(channel_id, [f"region_{channel_id}"])
+
+        return manager
+
+    def load(self) -> QueueManager:
+        manager = self.make_manager()
+        manager._load_from_disk(self.path, os.path.join(self.directory, "queue_state.json"))
+
+        return manager
+
+    def truncate(self, size: int):
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+
+    def test_roundtrip(self):
+        manager = self.load()
+
+        for channel_id in range(CHANNELS):
+            self.assertEqual(manager.channel(channel_id).get_nation_names(), self.expected[channel_id])
+
+    def test_truncated(self):
+        size = os.path.getsize(self.path)
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        for cut in (0, 40, 200, size // 2, size - 5):
+            with self.subTest(size=cut):
+                with open(self.path, "wb") as f:
+                    f.write(data)
+
+                self.truncate(cut)
+
+                with self.assertRaises(SnapshotError):
+                    Snapshot(self.path)
+
+                # a corrupt snapshot is logged and the queues start empty, as a corrupt queue_state.json used to
+                with self.assertLogs("main", "ERROR"):
+                    manager = self.load()
+
+                for channel_id in range(CHANNELS):
+                    self.assertEqual(manager.channel(channel_id).get_nation_count(), 0)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, "wb") as f:
+            f.write(b"{}" * 100)
+
+        with self.assertRaises(SnapshotError):
+            Snapshot(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
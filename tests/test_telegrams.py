@@ -0,0 +1,305 @@
+"""Telegram reports read from the daily rollup plus the partial days at either end, the streak runs kept beside it, and
+the spool and rejected file the write-behind buffer falls back on.
+
+uv run -m unittest tests.test_telegrams
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import random
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import aiomysql
+
+from components.telegrams import TelegramBuffer, report_params
+
+EPOCH = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def reported(telegrams: list[tuple[int, datetime]], params: tuple) -> dict[int, tuple[int, int]]:
+    "telegram count and active days per recruiter, as REPORT_QUERY adds them up from its parameters"
+    _channel_id, first, last, _channel_id, start_time, first_day, last_day, end_time = params
+    days: dict[int, list[date]] = {}
+
+    # the rollup holds every telegram of a day, so a day read from it counts all of them
+    for recruiter_id, timestamp in telegrams:
+        if first <= timestamp.date() < last or start_time <= timestamp < first_day or last_day <= timestamp <= end_time:
+            days.setdefault(recruiter_id, []).append(timestamp.date())
+
+    return {recruiter_id: (len(active), len(set(active))) for recruiter_id, active in days.items()}
+
+
+def counted(telegrams: list[tuple[int, datetime]], start_time: datetime, end_time: datetime) -> dict[int, tuple[int, int]]:
+    "telegram count and active days per recruiter, read straight from the telegrams"
+    days: dict[int, list[date]] = {}
+
+    for recruiter_id, timestamp in telegrams:
+        if start_time <= timestamp <= end_time:
+            days.setdefault(recruiter_id, []).append(timestamp.date())
+
+    return {recruiter_id: (len(active), len(set(active))) for recruiter_id, active in days.items()}
+
+
+class ReportTest(unittest.TestCase):
+    def test_partial_days(self):
+        rnd = random.Random(0)
+        telegrams = [(rnd.randint(1, 4), EPOCH + timedelta(seconds=rnd.randrange(10 * 86400))) for _ in range(2000)]
+        # telegrams on the stroke of midnight, which belong to the day they start
+        telegrams += [(5, EPOCH + timedelta(days=day)) for day in range(10)]
+
+        ranges = [
+            (EPOCH, EPOCH + timedelta(days=10)),
+            (EPOCH + timedelta(hours=5), EPOCH + timedelta(hours=20)),
+            (EPOCH + timedelta(hours=20), EPOCH + timedelta(days=1, hours=3)),
+            (EPOCH + timedelta(hours=20), EPOCH + timedelta(days=1)),
+            (EPOCH + timedelta(days=1), EPOCH + timedelta(days=2)),
+            (EPOCH + timedelta(days=2), EPOCH + timedelta(days=2)),
+        ]
+
+        for _ in range(200):
+            start_time = EPOCH + timedelta(seconds=rnd.randrange(10 * 86400))
+            ranges.append((start_time, start_time + timedelta(seconds=rnd.randrange(4 * 86400))))
+
+        for start_time, end_time in ranges:
+            with self.subTest(start=start_time, end=end_time):
+                self.assertEqual(reported(telegrams, report_params(3, start_time, end_time)), counted(telegrams, start_time, end_time))
+
+    def test_no_whole_day(self):
+        start_time = EPOCH + timedelta(hours=20)
+        params = report_params(3, start_time, EPOCH + timedelta(days=1, hours=3))
+
+        # the rollup range is empty, and the whole range is read from the telegrams
+        self.assertEqual(params[1], params[2])
+        self.assertEqual(params[5:7], (start_time, start_time))
+
+
+class StreakCursor:
+    "the telegram_streaks table in memory, for the statements of TelegramBuffer._record_day"
+
+    streaks: dict[int, list]
+    "[channel id, recruiter id, start day, last day] by id"
+
+    def __init__(self):
+        self.streaks = {}
+        self._next_id = 1
+        self._rows = []
+
+    async def execute(self, query: str, args: tuple = ()):
+        statement = query.split()[0]
+
+        if statement == "SELECT":
+            channel_id, recruiter_id, after, before = args
+            self._rows = [
+                (streak_id, start, last)
+                for streak_id, (channel, recruiter, start, last) in self.streaks.items()
+                if channel == channel_id and recruiter == recruiter_id and last >= after and start <= before
+            ]
+        elif statement == "UPDATE":
+            day, streak_id = args
+            self.streaks[streak_id][3 if "SET lastDay" in query else 2] = day
+        elif statement == "DELETE":
+            del self.streaks[args[0]]
+        elif statement == "INSERT":
+            self.streaks[self._next_id] = list(args)
+            self._next_id += 1
+
+    async def fetchall(self) -> list[tuple]:
+        return self._rows
+
+
+def runs(days: set[date]) -> list[tuple[date, date]]:
+    "the runs of consecutive days, as (start, last)"
+    result = []
+
+    for day in sorted(days):
+        if result and result[-1][1] == day - timedelta(days=1):
+            result[-1] = (result[-1][0], day)
+        else:
+            result.append((day, day))
+
+    return result
+
+
+class StreakTest(unittest.TestCase):
+    def record(self, cur: StreakCursor, recruiter_id: int, days: list[date]):
+        for day in days:
+            asyncio.run(TelegramBuffer._record_day(cur, 3, recruiter_id, day))
+
+    def streaks(self, cur: StreakCursor, recruiter_id: int) -> list[tuple[date, date]]:
+        return sorted((start, last) for _channel, recruiter, start, last in cur.streaks.values() if recruiter == recruiter_id)
+
+    def test_extend_and_join(self):
+        cur = StreakCursor()
+        day = EPOCH.date()
+
+        self.record(cur, 1, [day, day + timedelta(days=1), day + timedelta(days=3)])
+        self.assertEqual(self.streaks(cur, 1), [(day, day + timedelta(days=1)), (day + timedelta(days=3), day + timedelta(days=3))])
+
+        # the day between the two streaks joins them, and a day before the first extends it back
+        self.record(cur, 1, [day + timedelta(days=2), day - timedelta(days=1), day + timedelta(days=2)])
+        self.assertEqual(self.streaks(cur, 1), [(day - timedelta(days=1), day + timedelta(days=3))])
+        self.assertEqual(len(cur.streaks), 1)
+
+    def test_days_in_any_order(self):
+        rnd = random.Random(1)
+        cur = StreakCursor()
+        active = {}
+
+        for recruiter_id in range(1, 6):
+            days = [EPOCH.date() + timedelta(days=rnd.randrange(60)) for _ in range(40)]
+            active[recruiter_id] = set(days)
+            self.record(cur, recruiter_id, days)
+
+        for recruiter_id, days in active.items():
+            with self.subTest(recruiter=recruiter_id):
+                self.assertEqual(self.streaks(cur, recruiter_id), runs(days))
+
+
+REFUSED = 99
+"a recruiter id the database refuses telegrams for, as if its row were missing"
+
+
+class Cursor:
+    def __init__(self, conn: "Connection"):
+        self._conn = conn
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query: str, args: tuple = ()):
+        pass
+
+    async def fetchall(self) -> list[tuple]:
+        return []
+
+    async def executemany(self, query: str, values: list[tuple]):
+        if "INTO telegrams" not in query:
+            return
+
+        if any(recruiter_id == REFUSED for recruiter_id, *_ in values):
+            raise aiomysql.IntegrityError(1452, "Cannot add or update a child row: a foreign key constraint fails")
+
+        self._conn.written += [recruiter_id for recruiter_id, *_ in values]
+
+
+class Connection:
+    def __init__(self, pool: "Pool"):
+        self._pool = pool
+        self.written = []
+
+    def cursor(self) -> Cursor:
+        return Cursor(self)
+
+    async def begin(self):
+        self.written = []
+
+    async def commit(self):
+        self._pool.committed += self.written
+
+    async def rollback(self):
+        self.written = []
+
+
+class Pool:
+    "a database that refuses telegrams of REFUSED, and cannot be reached after reachable_for more connections"
+
+    committed: list[int]
+    "recruiter ids of the telegrams written, in order"
+    reachable_for: Optional[int]
+    "None when the database is always reachable"
+
+    def __init__(self):
+        self.committed = []
+        self.reachable_for = None
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        if self.reachable_for is not None:
+            if self.reachable_for == 0:
+                raise aiomysql.OperationalError(2003, "Can't connect to MySQL server")
+
+            self.reachable_for -= 1
+
+        yield Connection(self)
+
+
+class SpoolTest(unittest.TestCase):
+    pool: Pool
+    buffer: TelegramBuffer
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.pool = Pool()
+        self.buffer = TelegramBuffer(self.pool, os.path.join(temporary.name, "telegram_spool.jsonl"))
+
+    def flush(self, *recruiter_ids: int):
+        for recruiter_id in recruiter_ids:
+            self.buffer.add(recruiter_id, 8, 3)
+
+        asyncio.run(self.buffer.flush())
+
+    def spooled(self, path: Optional[str] = None) -> list[int]:
+        "recruiter ids of the telegrams in the spool, or another file the buffer writes"
+        path = path or self.buffer._spool_path
+
+        if not os.path.exists(path):
+            return []
+
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line)[0] for line in f]
+
+    def test_refused_row_set_aside(self):
+        with self.assertLogs("main", "ERROR"):
+            self.flush(1, REFUSED, 2)
+
+        self.assertEqual(self.pool.committed, [1, 2])
+        self.assertEqual(self.spooled(self.buffer._rejected_path), [REFUSED])
+        self.assertFalse(os.path.exists(self.buffer._spool_path))
+
+    def test_spooled_while_unreachable(self):
+        self.pool.reachable_for = 0
+
+        with self.assertLogs("main", "WARNING"):
+            self.flush(1, REFUSED)
+
+        self.assertEqual(self.spooled(), [1, REFUSED])
+
+        # the spool goes ahead of the buffer once the database is back, and the refused row is still set aside
+        self.pool.reachable_for = None
+
+        with self.assertLogs("main", "ERROR"):
+            self.flush(2, 3)
+
+        self.assertEqual(self.pool.committed, [1, 2, 3])
+        self.assertEqual(self.spooled(self.buffer._rejected_path), [REFUSED])
+        self.assertFalse(os.path.exists(self.buffer._spool_path))
+
+    def test_unreachable_part_way_through(self):
+        # the batch and the first two rows on their own get a connection, and the rest are spooled for the next flush
+        self.pool.reachable_for = 3
+
+        with self.assertLogs("main", "WARNING"):
+            self.flush(4, REFUSED, 5, 6, 7)
+
+        self.assertEqual(self.pool.committed, [4])
+        self.assertEqual(self.spooled(), [5, 6, 7])
+        self.assertEqual(self.spooled(self.buffer._rejected_path), [REFUSED])
+
+        self.pool.reachable_for = None
+        self.flush()
+
+        self.assertEqual(self.pool.committed, [4, 5, 6, 7])
+        self.assertFalse(os.path.exists(self.buffer._spool_path))
+
+
+if __name__ == "__main__":
+    unittest.main()